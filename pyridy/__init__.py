@@ -1,2 +1,23 @@
-from .campaign import Campaign
+import importlib
+
 from .config import options
+
+_SUBMODULES = ["analysis", "cache", "campaign", "config", "file", "osm", "processing", "utils"]
+
+
+def __getattr__(name: str):
+    # Campaign pulls in pandas, scipy, networkx and the OSM modules, so it is only imported on first access
+    if name == "Campaign":
+        from .campaign import Campaign
+        globals()["Campaign"] = Campaign
+        return Campaign
+
+    # Importing the package eagerly made its submodules available as attributes, e.g., pyridy.utils
+    if name in _SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(list(globals()) + ["Campaign"] + _SUBMODULES))
@@ -0,0 +1,59 @@
+import logging
+from functools import reduce
+from typing import List, Type
+
+import numpy as np
+import pandas as pd
+
+from .file import RDYFile
+from .utils import TimeSeries, merge_sorted_times
+
+logger = logging.getLogger(__name__)
+
+
+def align_devices(files: List[RDYFile], series: Type[TimeSeries], how: str = "left") -> List[pd.DataFrame]:
+    """ Aligns a measurement series of several files, e.g., of devices that recorded simultaneously, on a common time
+    index. The files should be synchronized with the same method beforehand. The sorted timestamps are aligned with
+    numpy instead of joining the DataFrames
+
+    Parameters
+    ----------
+    files: list of RDYFile
+        Files to align
+    series: TimeSeries
+        Class of the series to align, e.g., AccelerationSeries
+    how: str, default: "left"
+        "left" uses the timestamps of the first file, "outer" the union and "inner" the intersection of the
+        timestamps of all files
+
+    Returns
+    -------
+        list of pd.DataFrame
+            One DataFrame per file, all indexed by the same timestamps
+    """
+    if how not in ["left", "outer", "inner"]:
+        raise ValueError("how must be either 'left', 'outer' or 'inner', not %s" % how)
+
+    if not files:
+        return []
+
+    data_frames = [f.measurements[series].to_df() for f in files]
+
+    # Duplicate timestamps of a device are reduced to their first sample, which allows aligning via reindex
+    data_frames = [df[~df.index.duplicated()].sort_index() for df in data_frames]
+    times = [df.index.values for df in data_frames]
+
+    if how == "left":
+        index = data_frames[0].index
+    elif how == "outer":
+        times = [t for t in times if len(t) > 0]
+        if not times:
+            return data_frames
+        merged, _ = merge_sorted_times(times)
+        index = pd.Index(merged[np.r_[True, merged[1:] != merged[:-1]]], name="time")
+    elif any(len(t) == 0 for t in times):
+        index = data_frames[0].index[:0]
+    else:
+        index = pd.Index(reduce(np.intersect1d, times), name="time")
+
+    return [df.reindex(index) for df in data_frames]
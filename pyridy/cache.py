@@ -0,0 +1,92 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from typing import List, Type, Union
+
+from . import config
+from .file import RDYFile
+from .utils import TimeSeries
+
+logger = logging.getLogger(__name__)
+
+# Part of the cache key, must be increased whenever the pickled attributes of RDYFile or the series change
+_CACHE_VERSION = 1
+
+
+def _cache_path(path: str, **kwargs) -> str:
+    """ Returns the path of the cache file for a Ridy file. The key contains the cache version, the path, modification
+    time and size of the file as well as the arguments it is loaded with, except for fast_read which does not change the
+    result
+
+    Parameters
+    ----------
+    path: str
+        Path to the Ridy file
+    kwargs
+        Arguments passed to RDYFile
+
+    Returns
+    -------
+    str
+    """
+    stat = os.stat(path)
+    kwargs.pop("fast_read", None)
+    series = kwargs.get("series")
+    if series is not None:
+        kwargs["series"] = sorted(s.__name__ for s in (series if type(series) == list else [series]))
+
+    key = repr((_CACHE_VERSION, os.path.abspath(path), stat.st_mtime_ns, stat.st_size, sorted(kwargs.items())))
+    return os.path.join(config.options["FILE_CACHE_DIR"], hashlib.sha1(key.encode()).hexdigest() + ".pkl")
+
+
+def load_or_parse(path: str, use_cache: bool = True,
+                  series: Union[List[Type[TimeSeries]], Type[TimeSeries]] = None, **kwargs) -> RDYFile:
+    """ Loads a Ridy file, using a pickled copy from a previous import if the file has not changed since
+
+    Parameters
+    ----------
+    path: str
+        Path to the Ridy file
+    use_cache: bool, default: True
+        If False, the file is always parsed and the cache is neither read nor written
+    series: TimeSeries or list of TimeSeries, default: None
+        Series that should be loaded
+    kwargs
+        Further arguments passed to RDYFile
+
+    Returns
+    -------
+    RDYFile
+    """
+    if not use_cache:
+        return RDYFile(path=path, series=series, **kwargs)
+
+    cache_path = _cache_path(path, series=series, **kwargs)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            logger.debug("(%s) Could not load cached file, parsing it again: %s" % (path, e))
+
+    rdy_file = RDYFile(path=path, series=series, **kwargs)
+
+    tmp_path = None
+    try:
+        os.makedirs(config.options["FILE_CACHE_DIR"], exist_ok=True)
+        # Write to a temporary file first so that concurrent imports never read a partially written cache file
+        with tempfile.NamedTemporaryFile("wb", dir=config.options["FILE_CACHE_DIR"], delete=False) as f:
+            tmp_path = f.name
+            pickle.dump(rdy_file, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+        tmp_path = None
+    except OSError as e:
+        logger.debug("(%s) Could not write cache file: %s" % (path, e))
+    finally:
+        # Temporary files of failed writes, e.g., if pickling raised, are not left behind in the cache directory
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return rdy_file
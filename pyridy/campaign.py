@@ -3,27 +3,66 @@ import json
 import logging
 import multiprocessing
 import os
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from multiprocessing import Pool
-from pathlib import Path
-from typing import List, Union, Tuple, Optional, Type
+from typing import Dict, List, Union, Tuple, Optional, Type, TYPE_CHECKING
 
 import networkx as nx
 import numpy as np
-from ipyleaflet import Map, Polyline, Marker, Icon, FullScreenControl, ScaleControl
-from ipywidgets import HTML
 from networkx import connected_components
 from tqdm.auto import tqdm
 
 from . import config
+from .cache import load_or_parse
 from .file import RDYFile
-from .osm import OSM, OSMRailwaySwitch, OSMRailwaySignal, OSMLevelCrossing
+from .osm import OSM, OSMRailwaySwitch
 from .osm.utils import boxes_to_edges, iou
 from .utils import GPSSeries, TimeSeries
+from .utils.tools import create_marker, add_zoom_gate, create_base_map
+
+if TYPE_CHECKING:
+    from ipyleaflet import Map, LayerGroup
 
 logger = logging.getLogger(__name__)
 
 
+def _scan_folder(folder: str, recursive: bool = True, exclude: List[str] = None):
+    """ Yields the paths of Ridy files (.rdy and .sqlite) in a folder in the same order as os.walk. Excluded files and
+    folders are skipped before they are descended into
+
+    Parameters
+    ----------
+    folder: str
+        Folder to search
+    recursive: bool, default: True
+        If True, subfolders are searched as well
+    exclude: list of str
+        Names of files or folders to skip
+    """
+    exclude = exclude or []
+    sub_folders = []
+
+    try:
+        entries = list(os.scandir(folder))
+    except OSError as e:
+        logger.debug("Could not scan folder %s: %s" % (folder, e))
+        return
+
+    for entry in entries:
+        if entry.name in exclude:
+            continue
+        if entry.is_dir():
+            # Like os.walk, symlinks to folders are not followed
+            if recursive and not entry.is_symlink():
+                sub_folders.append(entry.path)
+        elif os.path.splitext(entry.name)[1] in [".rdy", ".sqlite"]:
+            yield entry.path
+
+    for sub_folder in sub_folders:
+        yield from _scan_folder(sub_folder, recursive=recursive, exclude=exclude)
+
+
 class Campaign:
     def __init__(self, name="",
                  folder: Union[list, str] = None,
@@ -84,7 +123,8 @@ class Campaign:
         """
         self.folder = folder
         self.name = name
-        self.files: List[RDYFile] = []
+        self._files: List[RDYFile] = []
+        self._by_name: Union[Dict[str, List[int]], None] = None  # Indices of the files by filename, see files
 
         # Geographic extent of campaign
         self.lat_sw, self.lon_sw = lat_sw, lon_sw
@@ -144,17 +184,53 @@ class Campaign:
             self.osm = None
 
     def __call__(self, name):
-        results = list(filter(lambda file: file.filename == name, self.files))
+        results = [self._files[i] for i in self._get_file_indices(name)]
         if len(results) == 1:
             return results[0]
         else:
             return results
 
+    def _get_file_indices(self, name: str) -> List[int]:
+        """ Returns the indices of the files with the given filename using a dict from filenames to indices. The dict
+        is built on the first lookup after the files changed and rebuilt if one of the found files was renamed
+
+        Parameters
+        ----------
+        name: str
+            Filename to look up
+
+        Returns
+        -------
+            list
+        """
+        if self._by_name is not None:
+            indices = self._by_name.get(name, [])
+            if all(self._files[i].filename == name for i in indices):
+                return indices
+
+        self._by_name = {}
+        for i, f in enumerate(self._files):
+            self._by_name.setdefault(f.filename, []).append(i)
+        return self._by_name.get(name, [])
+
+    @property
+    def files(self) -> List[RDYFile]:
+        """ Files of the campaign. Since the returned list may be modified by the caller, e.g., by replacing a file, the
+        dict used to look up files by name is rebuilt on the next lookup
+        """
+        self._by_name = None
+        return self._files
+
+    @files.setter
+    def files(self, value: List[RDYFile]):
+        self._by_name = None
+        self._files = value
+
     def __getitem__(self, index) -> RDYFile:
-        return self.files[index]
+        return self._files[index]
 
     def __len__(self):
-        return len(self.files)
+        return len(self._files)
 
     @property
     def osm(self):
@@ -169,7 +245,7 @@ class Campaign:
 
         self._osm = value
 
-    def add_tracks_to_map(self, m: Map) -> Map:
+    def add_tracks_to_map(self, m: "Map") -> "Map":
         """ Add all GPS tracks from the campaign files to a Map
 
         Parameters
@@ -182,12 +258,23 @@ class Campaign:
         Map
 
         """
-        for file in self.files:
-            m = self.add_track_to_map(m, file=file)
+        from ipyleaflet import LayerGroup
+
+        max_points = config.options["MAP_MAX_TRACK_POINTS"]
+
+        # Coordinate conversion and simplification runs in threads, widgets are created on the calling thread
+        with ThreadPoolExecutor() as executor:
+            coords = list(executor.map(lambda f: f.get_map_coords(max_points=max_points), self._files))
+
+        layers = [layer for layer in (self._create_track_layer(f, max_points, c) for f, c in zip(self._files, coords))
+                  if layer]
+
+        # Single layer mutation instead of one per polyline/marker
+        m.add_layer(LayerGroup(layers=layers))
 
         return m
 
-    def add_track_to_map(self, m: Map, name: str = "", file: RDYFile = None) -> Map:
+    def add_track_to_map(self, m: "Map", name: str = "", file: RDYFile = None, max_points: int = None) -> "Map":
         """ Adds a GPS track from a file to the Map
 
         Parameters
@@ -198,6 +285,9 @@ class Campaign:
             Name of the file that should be drawn onto the map
         file: RDYFile
             Alternatively, provide RDYFile that should be drawn on the map
+        max_points: int, default: None
+            Maximum number of points of the drawn track, longer tracks are simplified. Defaults to
+            config.options["MAP_MAX_TRACK_POINTS"]
 
         Returns
         -------
@@ -212,61 +302,63 @@ class Campaign:
         else:
             raise ValueError("You must provide either a filename or the file")
 
-        for f in files:
-            gps_series = f.measurements[GPSSeries]
-            coords = gps_series.to_ipyleaflef()
-
-            if coords != [[]]:
-                file_polyline = Polyline(locations=coords, color=f.color, fill=False, weight=4,
-                                         dash_array='10, 10')
-                m.add_layer(file_polyline)
-
-                # Add Start/End markers
-                start_icon = Icon(
-                    icon_url='https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/marker-icon-green.png',
-                    shadow_url='https://cdnjs.cloudflare.com/ajax/libs/leaflet/0.7.7/images/marker-shadow.png',
-                    icon_size=[25, 41],
-                    icon_anchor=[12, 41],
-                    popup_anchor=[1, -34],
-                    shadow_size=[41, 41])
-
-                end_icon = Icon(
-                    icon_url='https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/marker-icon-red.png',
-                    shadow_url='https://cdnjs.cloudflare.com/ajax/libs/leaflet/0.7.7/images/marker-shadow.png',
-                    icon_size=[25, 41],
-                    icon_anchor=[12, 41],
-                    popup_anchor=[1, -34],
-                    shadow_size=[41, 41])
-
-                start_marker = Marker(location=tuple(coords[0]), draggable=False, icon=start_icon)
-                end_marker = Marker(location=tuple(coords[-1]), draggable=False, icon=end_icon)
-
-                start_message = HTML()
-                end_message = HTML()
-                start_message.value = "<p>Start:</p><p>" \
-                                      + str(f.filename or '') + "</p><p>" \
-                                      + str(getattr(f.device, "manufacturer", "")) + "; " \
-                                      + str(getattr(f.device, "model", "")) + "</p>"
-                end_message.value = "<p>End:</p><p>" \
-                                    + str(f.filename or '') + "</p><p>" \
-                                    + str(getattr(f.device, "manufacturer", "")) + "; " \
-                                    + str(getattr(f.device, "model", "")) + "</p>"
-
-                start_marker.popup = start_message
-                end_marker.popup = end_message
-
-                m.add_layer(start_marker)
-                m.add_layer(end_marker)
+        from ipyleaflet import LayerGroup
+
+        if max_points is None:
+            max_points = config.options["MAP_MAX_TRACK_POINTS"]
+
+        layers = [layer for layer in (self._create_track_layer(f, max_points) for f in files) if layer]
+        m.add_layer(LayerGroup(layers=layers))
 
         return m
 
-    def add_osm_routes_to_map(self, m: Map) -> Map:
+    @staticmethod
+    def _create_track_layer(f: RDYFile, max_points: int, coords: List[list] = None) -> Optional["LayerGroup"]:
+        """ Creates a layer group containing the GPS track and start/end markers of a file
+
+        Parameters
+        ----------
+        f: RDYFile
+            File whose GPS track should be drawn
+        max_points: int
+            Maximum number of points of the drawn track
+        coords: list, default: None
+            Precomputed track coordinates, if None they are retrieved from the file
+
+        Returns
+        -------
+        LayerGroup
+            None if the file has no GPS coordinates
+        """
+        from ipyleaflet import LayerGroup, Polyline
+
+        if coords is None:
+            coords = f.get_map_coords(max_points=max_points)
+
+        if coords == [[]]:
+            return None
+
+        file_polyline = Polyline(locations=coords, color=f.color, fill=False, weight=4, dash_array='10, 10')
+
+        # Popup content shared by start and end marker
+        info = "<p>%s</p><p>%s; %s</p>" % (f.filename or '', getattr(f.device, "manufacturer", ""),
+                                           getattr(f.device, "model", ""))
+
+        start_marker = create_marker(*coords[0], color="green", popup="<p>Start:</p>" + info)
+        end_marker = create_marker(*coords[-1], color="red", popup="<p>End:</p>" + info)
+
+        return LayerGroup(layers=[file_polyline, start_marker, end_marker])
+
+    def add_osm_routes_to_map(self, m: "Map", min_zoom: int = None) -> "Map":
         """ Adds OSM Routes from the downloaded OSM Region
 
         Parameters
         ----------
         m: Map
             ipyleaflet Map
+        min_zoom: int, default: None
+            Routes are only shown if the map is zoomed in at least to this level. Defaults to
+            config.options["MAP_OSM_ROUTES_MIN_ZOOM"]
 
         Returns
         -------
@@ -274,18 +366,28 @@ class Campaign:
 
         """
         if self.osm:
+            from ipyleaflet import LayerGroup, Polyline
+
+            if min_zoom is None:
+                min_zoom = config.options["MAP_OSM_ROUTES_MIN_ZOOM"]
+
+            polylines = []
             for line in self.osm.railway_lines:
-                for track in line.tracks:
-                    coords = track.to_ipyleaflet()
-                    file_polyline = Polyline(locations=coords, color=line.color, fill=False, weight=4)
-                    m.add_layer(file_polyline)
+                # One multi-polyline per railway line instead of one layer per track
+                coords = [track.to_ipyleaflet() for track in line.tracks if len(track.lat) > 0]
+                if coords:
+                    polylines.append(Polyline(locations=coords, color=line.color, fill=False, weight=4))
+
+            group = LayerGroup(layers=polylines if m.zoom >= min_zoom else [])
+            m.add_layer(group)
+            add_zoom_gate(m, group, polylines, min_zoom)
         else:
             logger.warning("No OSM region downloaded!")
 
         return m
 
-    def add_osm_railway_elements_to_map(self, m: Map) -> Map:
-        """ Draws railway elements using markers on top of a map
+    def add_osm_railway_elements_to_map(self, m: "Map") -> "Map":
+        """ Draws railway elements as points on top of a map
 
         Parameters
         ----------
@@ -299,24 +401,21 @@ class Campaign:
 
         """
         if self.osm:
-            for el in self.osm.railway_elements:
-                if type(el) == OSMRailwaySwitch:
-                    icon = Icon(
-                        icon_url='https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/marker-icon-black.png',
-                        shadow_url='https://cdnjs.cloudflare.com/ajax/libs/leaflet/0.7.7/images/marker-shadow.png',
-                        icon_size=[25, 41],
-                        icon_anchor=[12, 41],
-                        popup_anchor=[1, -34],
-                        shadow_size=[41, 41])
-                    marker = Marker(location=(el.lat, el.lon), draggable=False, icon=icon)
-
-                    m.add_layer(marker)
-                elif type(el) == OSMRailwaySignal:
-                    pass
-                elif type(el) == OSMLevelCrossing:
-                    pass
-                else:
-                    pass
+            from ipyleaflet import GeoJSON
+
+            # Only switches are drawn, other railway elements are skipped without dispatching
+            switches = [el for el in self.osm.railway_elements if type(el) == OSMRailwaySwitch]
+
+            # Plain dots in a single layer instead of a marker widget per switch
+            data = {"type": "FeatureCollection",
+                    "features": [{"type": "Feature",
+                                  "geometry": {"type": "MultiPoint",
+                                               "coordinates": [[el.lon, el.lat] for el in switches]},
+                                  "properties": {}}]}
+            m.add_layer(GeoJSON(data=data, name="Railway switches",
+                                point_style={"radius": 4, "color": "black", "fillColor": "black", "weight": 1,
+                                             "fillOpacity": 1}))
+
         return m
 
     def clear_files(self):
@@ -327,7 +426,8 @@ class Campaign:
 
     def create_map(self, center: Tuple[float, float] = None,
                    show_gps_tracks=True,
-                   show_railway_elements=False) -> Map:
+                   show_railway_elements=False,
+                   show_osm_routes=True) -> "Map":
         """ Creates a ipyleaflet map showing the GPS tracks of measurement files
 
         Parameters
@@ -335,6 +435,8 @@ class Campaign:
         show_gps_tracks
         center
         show_railway_elements
+        show_osm_routes: bool, default: True
+            If False, OSM routes are not drawn, which avoids creating their layers for large OSM regions
 
         Returns
         -------
@@ -348,15 +450,11 @@ class Campaign:
             else:
                 raise ValueError("Cant determine geographic center of campaign, enter manually using 'center' argument")
 
-        m = Map(center=center, zoom=12, scroll_wheel_zoom=True, basemap=config.OPEN_STREET_MAP_DE)
-        m.add_control(ScaleControl(position='bottomleft'))
-        m.add_control(FullScreenControl())
-
-        # Add map
-        m.add_layer(config.OPEN_RAILWAY_MAP)
+        m = create_base_map(center=center)
 
         # Plot GPS point for each measurement and OSM Tracks
-        m = self.add_osm_routes_to_map(m)
+        if show_osm_routes:
+            m = self.add_osm_routes_to_map(m)
 
         if show_gps_tracks:
             m = self.add_tracks_to_map(m)
@@ -375,7 +473,7 @@ class Campaign:
         min_lons = []
         max_lons = []
 
-        for f in self.files:
+        for f in self._files:
             gps_series = f.measurements[GPSSeries]
             if gps_series.is_empty():
                 continue
@@ -419,7 +517,7 @@ class Campaign:
         pass
 
     def download_osm_data(self):
-        self.bboxs = [f.bbox for f in self.files if f.bbox]
+        self.bboxs = [f.bbox for f in self._files if f.bbox]
         self.s_bboxs = []  # Filtered bounding boxes
 
         # Unify bounding boxes with a large overlap to reduce number of queries
@@ -482,7 +580,10 @@ class Campaign:
                      download_osm_region: bool = False,
                      railway_types: Union[list, str] = None,
                      osm_recurse_type: Optional[str] = None,
-                     series: Union[List[Type[TimeSeries]], Type[TimeSeries]] = None):
+                     series: Union[List[Type[TimeSeries]], Type[TimeSeries]] = None,
+                     n_workers: int = None,
+                     fast_read: bool = True,
+                     use_cache: bool = None):
         """ Import files into the campaign
 
         Parameters
@@ -508,6 +609,13 @@ class Campaign:
             Recurse type to be used when querying OSM data using the overpass API
         use_multiprocessing : bool, default: True
             If True, uses multiprocessing to import Ridy files
+        n_workers : int, default: None
+            Number of processes used if use_multiprocessing is True, defaults to the number of CPUs
+        fast_read : bool, default: True
+            If True, sqlite files are opened read-only using pragmas that speed up reading
+        use_cache : bool, default: None
+            If True, parsed files are cached on disk and reused as long as the file is unchanged, defaults to
+            config.options["FILE_CACHE"]
         """
         if osm_recurse_type:
             self.osm_recurse_type = osm_recurse_type
@@ -532,24 +640,40 @@ class Campaign:
             else:
                 raise ValueError("series argument must be list of TimeSeries or TimeSeries! not %s" % type(series))
 
+        if use_cache is None:
+            use_cache = config.options["FILE_CACHE"]
+
         if use_multiprocessing:
-            with Pool(multiprocessing.cpu_count()) as p:
-                files = list(tqdm(p.imap(partial(RDYFile,
+            # Largest files are dispatched first and one at a time so that they do not end up at the tail
+            order = sorted(range(len(file_paths)), key=lambda i: os.path.getsize(file_paths[i]), reverse=True)
+
+            files = [None] * len(file_paths)
+            with Pool(n_workers or multiprocessing.cpu_count()) as p:
+                results = p.imap(partial(load_or_parse,
+                                         use_cache=use_cache,
+                                         sync_method=sync_method,
+                                         timedelta_unit=timedelta_unit,
+                                         strip_timezone=strip_timezone,
+                                         cutoff=cutoff,
+                                         series=self._series,
+                                         fast_read=fast_read), [file_paths[i] for i in order], chunksize=1)
+                for i, f in zip(order, tqdm(results, total=len(order))):
+                    files[i] = f
+
+            # Keep the order of file_paths
+            self._files.extend(files)
+        else:
+            for p in tqdm(file_paths):
+                self._files.append(load_or_parse(p,
+                                                 use_cache=use_cache,
                                                  sync_method=sync_method,
+                                                 timedelta_unit=timedelta_unit,
                                                  strip_timezone=strip_timezone,
                                                  cutoff=cutoff,
-                                                 series=self._series), file_paths)))
-                for f in files:
-                    self.files.append(f)
-        else:
-            for p in tqdm(file_paths):
-                self.files.append(RDYFile(path=p,
-                                          sync_method=sync_method,
-                                          timedelta_unit=timedelta_unit,
-                                          strip_timezone=strip_timezone,
-                                          cutoff=cutoff,
-                                          series=self._series))
+                                                 series=self._series,
+                                                 fast_read=fast_read))
 
+        self._by_name = None
         self.railway_types = railway_types
 
         if osm_recurse_type:
@@ -588,30 +712,6 @@ class Campaign:
         else:
             raise TypeError("folder argument must be list or str")
 
-        file_paths = []
-
-        for fdr in folder:
-            if recursive:
-                all_paths = list(Path(fdr).rglob("*"))
-
-                # File paths without excluded files or folder names
-                for p in all_paths:
-                    inter = set(p.parts).intersection(set(exclude))
-                    if len(inter) > 0:
-                        continue
-                    else:
-                        if p.suffix in [".rdy", ".sqlite"]:
-                            file_paths.append(p)
-                        else:
-                            continue
-            else:
-                _, _, files = next(os.walk(fdr))
-                for f in files:
-                    file_path = os.path.join(fdr, f)
-                    _, ext = os.path.splitext(file_path)
-                    if f not in exclude and ext in [".rdy", ".sqlite"]:
-                        file_paths.append(file_path)
-
-                pass
+        file_paths = [p for fdr in folder for p in _scan_folder(fdr, recursive=recursive, exclude=exclude)]
 
         self.import_files(file_paths, **kwargs)
@@ -1,47 +1,57 @@
+import os
+
 import pyproj
-from ipyleaflet import Icon, TileLayer
 
 
 # Projections
 proj = pyproj.Proj(proj='utm', zone=32, ellps='WGS84', preserve_units=True)
 geod = pyproj.Geod(ellps='WGS84')
 
-# Maps
-OPEN_STREET_MAP_DE = TileLayer(
-    url='https://{s}.tile.openstreetmap.de/{z}/{x}/{y}.png',
-    max_zoom=19,
-    name="OpenStreetMap"
-)
+# Maps and markers, created on first access so that ipyleaflet is only imported when maps are drawn
+_ICON_URL = 'https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/marker-icon-%s.png'
+_widgets = {}
+
+
+def _create_widget(name: str):
+    from ipyleaflet import Icon, TileLayer
+
+    if name == "OPEN_STREET_MAP_DE":
+        return TileLayer(
+            url='https://{s}.tile.openstreetmap.de/{z}/{x}/{y}.png',
+            max_zoom=19,
+            name="OpenStreetMap"
+        )
+    elif name == "OPEN_STREET_MAP_BW":  # No longer maintained
+        return TileLayer(
+            url='https://{s}.tiles.wmflabs.org/bw-mapnik/{z}/{x}/{y}.png',
+            max_zoom=19,
+            name="OpenStreetMap BW"
+        )
+    elif name == "OPEN_RAILWAY_MAP":
+        return TileLayer(
+            url='https://{s}.tiles.openrailwaymap.org/standard/{z}/{x}/{y}.png',
+            max_zoom=19,
+            attribution='<a href="https://www.openstreetmap.org/copyright">© OpenStreetMap contributors</a>, Style: <a href="http://creativecommons.org/licenses/by-sa/2.0/">CC-BY-SA 2.0</a> <a href="http://www.openrailwaymap.org/">OpenRailwayMap</a> and OpenStreetMap',
+            name='OpenRailwayMap'
+        )
+    else:  # Start/End markers
+        return Icon(
+            icon_url=_ICON_URL % ("green" if name == "START_ICON" else "red"),
+            shadow_url='https://cdnjs.cloudflare.com/ajax/libs/leaflet/0.7.7/images/marker-shadow.png',
+            icon_size=[25, 41],
+            icon_anchor=[12, 41],
+            popup_anchor=[1, -34],
+            shadow_size=[41, 41])
 
-OPEN_STREET_MAP_BW = TileLayer(  # No longer maintained
-    url='https://{s}.tiles.wmflabs.org/bw-mapnik/{z}/{x}/{y}.png',
-    max_zoom=19,
-    name="OpenStreetMap BW"
-)
 
-OPEN_RAILWAY_MAP = TileLayer(
-    url='https://{s}.tiles.openrailwaymap.org/standard/{z}/{x}/{y}.png',
-    max_zoom=19,
-    attribution='<a href="https://www.openstreetmap.org/copyright">© OpenStreetMap contributors</a>, Style: <a href="http://creativecommons.org/licenses/by-sa/2.0/">CC-BY-SA 2.0</a> <a href="http://www.openrailwaymap.org/">OpenRailwayMap</a> and OpenStreetMap',
-    name='OpenRailwayMap'
-)
+def __getattr__(name: str):
+    if name in ("OPEN_STREET_MAP_DE", "OPEN_STREET_MAP_BW", "OPEN_RAILWAY_MAP", "START_ICON", "END_ICON"):
+        if name not in _widgets:
+            _widgets[name] = _create_widget(name)
+        return _widgets[name]
 
-# Add Start/End markers
-START_ICON = Icon(
-    icon_url='https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/marker-icon-green.png',
-    shadow_url='https://cdnjs.cloudflare.com/ajax/libs/leaflet/0.7.7/images/marker-shadow.png',
-    icon_size=[25, 41],
-    icon_anchor=[12, 41],
-    popup_anchor=[1, -34],
-    shadow_size=[41, 41])
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
-END_ICON = Icon(
-    icon_url='https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/marker-icon-red.png',
-    shadow_url='https://cdnjs.cloudflare.com/ajax/libs/leaflet/0.7.7/images/marker-shadow.png',
-    icon_size=[25, 41],
-    icon_anchor=[12, 41],
-    popup_anchor=[1, -34],
-    shadow_size=[41, 41])
 
 # Options that can be altered by user
 options = {
@@ -51,13 +61,21 @@ options = {
     "OSM_BOUNDING_BOX_SPLIT_IOU_THRES": .5,
     "OSM_SINGLE_BOUNDING_BOX": False,
     "SOCKET_TIMEOUT": 300,
+    "INTERNET_CHECK_INTERVAL": 5.0,
     "MAP_MATCHING_DEFAULT_ALGORITHM": "nx",
     "MAP_MATCHING_V_THRES": 1.0,
     "MAP_MATCHING_ALPHA": 1.0,
     "MAP_MATCHING_BETA": 1.0,
     "MAP_MATCHING_MIN_LINE_MATCH_RATIO": .2,
     "TRACK_RESOLUTION": .5,
-    "RESULT_MATCHING_MAX_DISTANCE": 5
+    "RESULT_MATCHING_MAX_DISTANCE": 5,
+    "MAP_MAX_TRACK_POINTS": 5000,
+    "MAP_HTML_SPOOL_SIZE": 4 * 1024 * 1024,
+    "MAP_OSM_ROUTES_MIN_ZOOM": 11,
+    "SQLITE_MMAP_SIZE": 256 * 1024 * 1024,
+    "SQLITE_CACHE_SIZE": -64 * 1024,  # Negative values are in KiB
+    "FILE_CACHE": False,
+    "FILE_CACHE_DIR": os.path.join(os.path.expanduser("~"), ".cache", "pyridy")
 }
 
 # Used colors
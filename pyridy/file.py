@@ -2,33 +2,186 @@ import datetime
 import itertools
 import json
 import logging
+import mmap
 import os
 import sqlite3
+from contextlib import closing
 from sqlite3 import DatabaseError
-from typing import Optional, List, Dict, Tuple, Union, Type
+from typing import Optional, List, Dict, Tuple, Union, Type, TYPE_CHECKING
 
 import networkx as nx
 import numpy as np
 import overpy
 import pandas as pd
-from ipyleaflet import Map, ScaleControl, FullScreenControl, Polyline, Marker, Circle, LayerGroup
-from ipywidgets import HTML
 from pandas.io.sql import DatabaseError as PandasDatabaseError
 from scipy.spatial import KDTree
-from scipy.stats import norm
 
 from pyridy import config
 from pyridy.osm import OSM, OSMRailwayLine
-from pyridy.osm.utils import is_point_within_line_projection, project_point_onto_line
+from pyridy.osm.utils import project_points_onto_lines
 from pyridy.utils import Sensor, AccelerationSeries, LinearAccelerationSeries, MagnetometerSeries, OrientationSeries, \
     GyroSeries, RotationSeries, GPSSeries, PressureSeries, HumiditySeries, TemperatureSeries, WzSeries, LightSeries, \
     SubjectiveComfortSeries, AccelerationUncalibratedSeries, MagnetometerUncalibratedSeries, GyroUncalibratedSeries, \
     GNSSClockMeasurementSeries, GNSSMeasurementSeries, NMEAMessageSeries, TimeSeries, NTPDatetimeSeries
 from pyridy.utils.device import Device
-from pyridy.utils.tools import generate_random_color
+from pyridy.utils.tools import generate_random_color, create_base_map
+
+if TYPE_CHECKING:
+    from ipyleaflet import Map
 
 logger = logging.getLogger(__name__)
 
+# Tables of the sqlite database containing the measurements of the respective series
+_SQLITE_MEASUREMENT_TABLES = {AccelerationSeries: "acc_measurements_table",
+                              AccelerationUncalibratedSeries: "acc_uncal_measurements_table",
+                              LinearAccelerationSeries: "lin_acc_measurements_table",
+                              MagnetometerSeries: "mag_measurements_table",
+                              MagnetometerUncalibratedSeries: "mag_uncal_measurements_table",
+                              OrientationSeries: "orient_measurements_table",
+                              GyroSeries: "gyro_measurements_table",
+                              GyroUncalibratedSeries: "gyro_uncal_measurements_table",
+                              RotationSeries: "rot_measurements_table",
+                              GPSSeries: "gps_measurements_table",
+                              GNSSMeasurementSeries: "gnss_measurement_table",
+                              GNSSClockMeasurementSeries: "gnss_clock_measurement_table",
+                              NMEAMessageSeries: "nmea_messages_table",
+                              PressureSeries: "pressure_measurements_table",
+                              TemperatureSeries: "temperature_measurements_table",
+                              HumiditySeries: "humidity_measurements_table",
+                              LightSeries: "light_measurements_table",
+                              WzSeries: "wz_measurements_table",
+                              SubjectiveComfortSeries: "subjective_comfort_measurements_table",
+                              NTPDatetimeSeries: "ntp_measurements_table"}
+
+
+def _read_sql_columns(db_con: sqlite3.Connection, table: str) -> Dict[str, np.ndarray]:
+    """ Reads a whole table directly into numpy arrays, one array per column. This bypasses the DataFrame
+    construction and type inference of pandas.read_sql_query, which dominates the loading time of large tables
+
+    Parameters
+    ----------
+    db_con: sqlite3.Connection
+        Connection to the sqlite database
+    table: str
+        Name of the table that should be read
+
+    Returns
+    -------
+        dict
+    """
+    # Tables that only contain declared INTEGER/REAL columns, i.e. all measurement tables, are converted in bulk,
+    # one 2D array per affinity
+    declared = [(r[1], r[2].upper()) for r in db_con.execute("PRAGMA table_info(%s)" % table)]
+    if declared and all(t in ("INTEGER", "REAL") for _, t in declared):
+        columns = {}
+        try:
+            for affinity, dtype in (("REAL", np.float64), ("INTEGER", None)):
+                names = [n for n, t in declared if t == affinity]
+                if not names:
+                    continue
+
+                rows = db_con.execute("SELECT %s from %s" % (", ".join(names), table)).fetchall()
+                arr = np.array(rows, dtype=dtype).reshape(-1, len(names))
+                if dtype is None and arr.size and arr.dtype != np.int64:
+                    raise TypeError("Column with INTEGER affinity contains non-integer values")
+
+                columns.update(zip(names, arr.T.copy()))
+                del rows, arr
+
+            return {n: columns[n] for n, _ in declared}
+        except (TypeError, ValueError):
+            pass  # Mixed or NULL values, fall back to per column conversion
+
+    cursor = db_con.execute("SELECT * from %s" % table)
+    names = [d[0] for d in cursor.description]
+    rows = cursor.fetchall()
+
+    if not rows:
+        return {name: np.array([]) for name in names}
+
+    columns = {}
+    for name, values in zip(names, zip(*rows)):
+        arr = np.array(values)
+        # NULL values in numeric columns become NaN, like when using pandas
+        if arr.dtype == object and all(v is None or isinstance(v, (int, float)) for v in values):
+            arr = arr.astype(np.float64)
+        columns[name] = arr
+
+    return columns
+
+
+def _connect_sqlite(path: str, fast_read: bool = True) -> sqlite3.Connection:
+    """ Opens a sqlite database for reading
+
+    Parameters
+    ----------
+    path: str
+        Path to the sqlite file
+    fast_read: bool, default: True
+        If True, the connection is restricted to queries, holds its lock for the whole connection instead of per
+        statement and uses memory mapped I/O, in-memory temp storage and a larger page cache
+
+    Returns
+    -------
+        sqlite3.Connection
+    """
+    if not fast_read:
+        return sqlite3.connect(path)
+
+    db_con = sqlite3.connect(path)
+    db_con.execute("PRAGMA query_only=ON")
+    db_con.execute("PRAGMA locking_mode=EXCLUSIVE")
+    db_con.execute("PRAGMA temp_store=MEMORY")
+    db_con.execute("PRAGMA mmap_size=%d" % config.options["SQLITE_MMAP_SIZE"])
+    db_con.execute("PRAGMA cache_size=%d" % config.options["SQLITE_CACHE_SIZE"])
+
+    return db_con
+
+
+def _load_json(path: str):
+    """ Parses a JSON file. If orjson is installed, the memory mapped file is parsed with it, otherwise or if orjson
+    rejects the file (e.g., because of NaN values), the standard json module is used
+
+    Parameters
+    ----------
+    path: str
+        Path to the JSON file
+
+    Returns
+    -------
+        dict
+    """
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+
+    if orjson is not None:
+        try:
+            with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf, \
+                    memoryview(buf) as view:
+                return orjson.loads(view)
+        except ValueError as e:  # Also raised by mmap for empty files, orjson.JSONDecodeError is a ValueError
+            logger.debug("(%s) Could not parse file with orjson, using json: %s" % (path, e))
+
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def _cols(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """ Converts a DataFrame into a dict of numpy arrays without wrapping each column into a pandas Series
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        DataFrame that should be converted
+
+    Returns
+    -------
+        dict
+    """
+    return {c: df[c].to_numpy(copy=False) for c in df.columns}
+
 
 class RDYFile:
     def __init__(self, path: str = "", sync_method: str = "timestamp", cutoff: bool = True,
@@ -36,7 +189,8 @@ class RDYFile:
                  strip_timezone: bool = True,
                  filename="",
                  series: Union[List[Type[TimeSeries]], Type[TimeSeries]] = None,
-                 color: str = None):
+                 color: str = None,
+                 fast_read: bool = True):
         """
 
         Parameters
@@ -55,8 +209,11 @@ class RDYFile:
             Strips timezone from timestamps as np.datetime64 does not support timezones
         filename: str
             Name of the files, will be the filename if not provided
+        fast_read: bool, default: True
+            If True, sqlite files are opened read-only using pragmas that speed up reading
         """
         self.path = path
+        self.fast_read = fast_read
 
         # Sanity check if series is arg is valid
         if series:
@@ -147,6 +304,9 @@ class RDYFile:
         self.matched_ways: Optional[List[overpy.Way]] = []  # Ways from Map Matching
         self.matched_line: Optional[OSMRailwayLine] = None  # Matched Railway Line
 
+        # Cached map coordinates of the GPS track, see get_map_coords
+        self._map_coords: Optional[tuple] = None
+
         if self.path:
             self.load_file(self.path)
 
@@ -184,13 +344,13 @@ class RDYFile:
     #     return self.measurements[key]
 
     def __iter__(self):
-        """
+        """ Iterates over the measurement series of the file
 
         Returns
         -------
-            FileIterator
+            Iterator[TimeSeries]
         """
-        return FileIterator(self)
+        return iter(self.measurements.values())
 
     def __repr__(self):
         return "Filename: %s, T0: %s, Duration: %s" % (self.filename,
@@ -212,55 +372,60 @@ class RDYFile:
         edges = []  # Candidate edges with emission probabilities
 
         # Perform search for node candidate on all GPS coords
+        way_segs = {}  # Line segments of each way as array of shape (M, 2, 2)
         for i, idxs in enumerate(indices):
             # Get unique ways based on indices
             c_ways = list(set(list(itertools.chain(*[self.osm.nodes[idx].ways for idx in idxs]))))
 
             # Find candidate line segments
             c_segs = []
-            for w in c_ways:
-                n = w.nodes
-                segs = []  # List of suitable line segments
-
-                for n1, n2 in zip(n, n[1:]):
-                    x1, y1 = n1.attributes["x"], n1.attributes["y"]
-                    x2, y2 = n2.attributes["x"], n2.attributes["y"]
-
-                    # Only take those line segment into consideration where the perpendicular projection
-                    # of the GPS coords lies inside the line segment
-                    b = is_point_within_line_projection(line=[[x1, y1], [x2, y2]], point=track_xy[i])
-                    if b:
+            if c_ways:
+                for w in c_ways:
+                    if w.id not in way_segs:
+                        xy = np.array([[n.attributes["x"], n.attributes["y"]] for n in w.nodes], dtype=np.float64)
+                        way_segs[w.id] = np.stack((xy[:-1], xy[1:]), axis=1).reshape(-1, 2, 2)
+
+                # Project the GPS point onto all line segments of all candidate ways at once
+                offsets = np.cumsum([0] + [len(way_segs[w.id]) for w in c_ways])
+                lines = np.concatenate([way_segs[w.id] for w in c_ways])
+                p, d, within = project_points_onto_lines(lines, track_xy[i])
+                p, d = p[0], d[0]
+
+                # Only take those line segment into consideration where the perpendicular projection
+                # of the GPS coords lies inside the line segment
+                valid = within[0] & (d < hor_acc[i])
+
+                for w, start, stop in zip(c_ways, offsets[:-1], offsets[1:]):
+                    if valid[start:stop].any():
+                        # Select candidate line segment based on smallest perpendicular distance
+                        k = start + np.argmin(np.where(valid[start:stop], d[start:stop], np.inf))
+                        n1, n2 = w.nodes[k - start], w.nodes[k - start + 1]
+
                         # Point of orthogonal intersection
-                        p, d = project_point_onto_line(line=[[x1, y1], [x2, y2]], point=track_xy[i])
-                        if d < hor_acc[i]:
-                            p_lon, p_lat = self.osm.utm_proj(p[0], p[1], inverse=True)
-                            segs.append([d, p_lon, p_lat, n1, n2, w.id, None, i])
-
-                if segs:
-                    segs = np.array(segs)
-                    i_min = np.argmin(
-                        segs[:, 0])  # Select candidate line segment based on smallest perpendicular distance
-                    n1, n2 = segs[i_min, 3], segs[i_min, 4]
-
-                    e1 = list(self.osm.G.edges(n1.id, keys=True))
-                    e2 = list(self.osm.G.edges(n2.id, keys=True))
-
-                    inter = list(set(e1).intersection(e2))
-                    if len(inter) == 0:  # TODO
-                        c_seg_e = e1[0]
-                    else:
-                        c_seg_e = inter[0]
+                        p_lon, p_lat = self.osm.utm_proj(p[k, 0], p[k, 1], inverse=True)
+
+                        e1 = list(self.osm.G.edges(n1.id, keys=True))
+                        e2 = list(self.osm.G.edges(n2.id, keys=True))
 
-                    c_seg = segs[i_min]
-                    c_segs.append(c_seg)
+                        inter = list(set(e1).intersection(e2))
+                        if len(inter) == 0:  # TODO
+                            c_seg_e = e1[0]
+                        else:
+                            c_seg_e = inter[0]
 
-                    edges.append([c_seg_e, hor_acc[i], c_seg[0]])
+                        c_seg = np.array([d[k], p_lon, p_lat, n1, n2, w.id, None, i], dtype=object)
+                        c_segs.append(c_seg)
+
+                        edges.append([c_seg_e, hor_acc[i], c_seg[0]])
 
             c_dict[i] = {"c_ways": c_ways, "c_segs": c_segs}
 
         # Calculate emission probabilities for each edge candidate
         c_edges = {}
         if edges:
+            # scipy.stats is slow to import and only needed for map matching
+            from scipy.stats import norm
+
             edges = np.array(edges, dtype='object')
             e_probs = norm.pdf(edges[:, 2].astype(float), np.zeros(len(edges)), edges[:, 1].astype(float))
 
@@ -330,7 +495,7 @@ class RDYFile:
                 "sync_method must 'timestamp', 'device_time', 'gps_time' or 'ntp_time' not %s" % self.sync_method)
         pass
 
-    def create_map(self, t_lim: Tuple[np.datetime64, np.datetime64] = None, show_hor_acc: bool = False) -> Map:
+    def create_map(self, t_lim: Tuple[np.datetime64, np.datetime64] = None, show_hor_acc: bool = False) -> "Map":
         """ Creates an ipyleaflet Map using OpenStreetMap and OpenRailwayMap to show the GPS track of the
         measurement file
 
@@ -347,8 +512,11 @@ class RDYFile:
         -------
             Map
         """
+        from ipyleaflet import Polyline, Marker, Circle, LayerGroup
+        from ipywidgets import HTML
+
         gps_series = self.measurements[GPSSeries]
-        coords = gps_series.to_ipyleaflef()
+        coords = self.get_map_coords()
         time = gps_series.time
         hor_acc = gps_series.hor_acc
 
@@ -370,16 +538,7 @@ class RDYFile:
 
             color = generate_random_color("HEX")
 
-            m = Map(center=self.determine_track_center()[::-1],
-                    zoom=12,
-                    scroll_wheel_zoom=True,
-                    basemap=config.OPEN_STREET_MAP_DE)
-
-            m.add_control(ScaleControl(position='bottomleft'))
-            m.add_control(FullScreenControl())
-
-            # Add map
-            m.add_layer(config.OPEN_RAILWAY_MAP)
+            m = create_base_map(center=self.determine_track_center()[::-1])
 
             file_polyline = Polyline(locations=coords, color=color, fill=False, weight=4, dash_array='10, 10')
             m.add_layer(file_polyline)
@@ -406,23 +565,40 @@ class RDYFile:
             m.add_layer(end_marker)
 
             if show_hor_acc:
-                circles = []
-                for c, h in zip(coords, hor_acc):
-                    circle = Circle()
-                    circle.location = (c[0], c[1])
-                    circle.radius = int(h)
-                    circle.color = "#00549F"
-                    circle.fill_color = "#00549F"
-                    circle.weight = 3
-                    circle.fill_opacity = 0.1
-
-                    circles.append(circle)
+                # All traits are passed to the constructor to avoid a change event per attribute
+                circles = [Circle(location=(c[0], c[1]), radius=int(h), color="#00549F", fill_color="#00549F",
+                                  weight=3, fill_opacity=0.1) for c, h in zip(coords, hor_acc)]
 
                 l_circles = LayerGroup(layers=circles)
                 m.add_layer(l_circles)
 
             return m
 
+    def get_map_coords(self, max_points: int = None) -> List[list]:
+        """ Returns the GPS track as [lat, lon] list as required by ipyleaflet. The result is cached until the
+        coordinates of the GPSSeries are replaced, e.g. by cutting the series
+
+        Parameters
+        ----------
+            max_points: int, default: None
+                If given, the track is simplified to at most max_points coordinates
+
+        Returns
+        -------
+            list
+        """
+        gps_series = self.measurements[GPSSeries]
+
+        if self._map_coords is not None:
+            lat, lon, cached_max_points, coords = self._map_coords
+            if lat is gps_series.lat and lon is gps_series.lon and cached_max_points == max_points:
+                return coords
+
+        coords = gps_series.to_ipyleaflef(max_points=max_points)
+        self._map_coords = (gps_series.lat, gps_series.lon, max_points, coords)
+
+        return coords
+
     def determine_track_center(self, gps_series: Optional[GPSSeries] = None) -> (float, float):
         """ Determines the geographical center of the GPSSeries, returns None if the GPSSeries is emtpy.
 
@@ -529,15 +705,17 @@ class RDYFile:
                                                                                       len(self.matched_nodes)))
 
                 if len(self.matched_nodes) > 0:
-                    m_ratios = [len(set(self.matched_nodes).intersection(line.nodes)) / len(self.matched_nodes) for line
+                    matched_nodes = set(self.matched_nodes)
+                    m_ratios = [len(matched_nodes.intersection(line.nodes)) / len(self.matched_nodes) for line
                                 in
                                 self.osm.railway_lines if self]
+                    best = int(np.argmax(m_ratios))
 
-                    if max(m_ratios) > config.options["MAP_MATCHING_MIN_LINE_MATCH_RATIO"]:
-                        self.matched_line = self.osm.railway_lines[m_ratios.index(max(m_ratios))]
+                    if m_ratios[best] > config.options["MAP_MATCHING_MIN_LINE_MATCH_RATIO"]:
+                        self.matched_line = self.osm.railway_lines[best]
                         logger.debug("(%s) Matched Railway Line: %s (%.f Match Ratio)" % (self.filename,
                                                                                           self.matched_line.name,
-                                                                                          max(m_ratios)))
+                                                                                          m_ratios[best]))
                     else:
                         logger.debug("(%s) Could not match map matching results to a specific railway line" %
                                      self.filename)
@@ -566,7 +744,7 @@ class RDYFile:
 
         attr = self.__dict__.copy()
         attr.update(attr["device"].__dict__.copy())
-        for a in ["measurements", "device", "sensors"]:
+        for a in ["measurements", "device", "sensors", "_map_coords"]:
             attr.pop(a)
             pass
 
@@ -599,8 +777,7 @@ class RDYFile:
         _, self.filename = os.path.split(path)
 
         if self.extension == ".rdy":
-            with open(path, 'r') as file:
-                rdy = json.load(file)
+            rdy = _load_json(path)
 
             if 'Ridy_Version' in rdy:
                 self.ridy_version = rdy['Ridy_Version']
@@ -871,311 +1048,114 @@ class RDYFile:
                     logger.debug("No NTP Datetime Series in file: %s" % self.filename)
 
         elif self.extension == ".sqlite":
-            db_con = sqlite3.connect(path)
-
-            try:
-                info: Dict = dict(pd.read_sql_query("SELECT * from measurement_information_table", db_con))
-            except (DatabaseError, PandasDatabaseError) as e:
-                logger.error(e)
-                # Older files can contain wrong table name
+            with closing(_connect_sqlite(path, fast_read=self.fast_read)) as db_con:
                 try:
-                    info = dict(pd.read_sql_query("SELECT * from measurment_information_table", db_con))
-                    logger.debug("(%s) Older file containing measu(rm)ent_information_table" % self.filename)
+                    info: Dict = _cols(pd.read_sql_query("SELECT * from measurement_information_table", db_con))
                 except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug(
-                        "(%s) DatabaseError occurred when accessing measurement_information_table" % self.filename)
-                    logger.debug(e)
-                    info = {}
-
-            try:
-                sensor_df = pd.read_sql_query("SELECT * from sensor_descriptions_table", db_con)
-                for _, row in sensor_df.iterrows():
-                    self.sensors.append(Sensor(**dict(row)))
-            except (DatabaseError, PandasDatabaseError) as e:
-                logger.debug(
-                    "(%s) DatabaseError occurred when accessing sensor_descriptions_table" % self.filename)
-                logger.debug(e)
-
-            try:
-                device_df = pd.read_sql_query("SELECT * from device_information_table", db_con)
-                self.device = Device(**dict(device_df))
-            except (DatabaseError, PandasDatabaseError) as e:
-                logger.debug("(%s) DatabaseError occurred when accessing device_information_table" % self.filename)
-                logger.debug(e)
-                self.device = Device()
-
-            # Info
-            if 'ridy_version' in info and len(info['ridy_version']) > 1:
-                logger.debug("Measurement information table contains more than 1 row!")
-
-            if 'ridy_version' in info and len(info['ridy_version']) > 0:
-                self.ridy_version = info['ridy_version'].iloc[-1]
-
-            if 'ridy_version_code' in info and len(info['ridy_version_code']) > 0:
-                self.ridy_version_code = info['ridy_version_code'].iloc[-1]
-
-            if 'rdy_format_version' in info and len(info['rdy_format_version']) > 0:
-                self.rdy_format_version = info['rdy_format_version'].iloc[-1]
-
-            if 'rdy_info_name' in info and len(info['rdy_info_name']) > 0:
-                self.rdy_info_name = info['rdy_info_name'].iloc[-1]
-
-            if 'rdy_info_sex' in info and len(info['rdy_info_sex']) > 0:
-                self.rdy_info_sex = info['rdy_info_sex'].iloc[-1]
+                    logger.error(e)
+                    # Older files can contain wrong table name
+                    try:
+                        info = _cols(pd.read_sql_query("SELECT * from measurment_information_table", db_con))
+                        logger.debug("(%s) Older file containing measu(rm)ent_information_table" % self.filename)
+                    except (DatabaseError, PandasDatabaseError) as e:
+                        logger.debug(
+                            "(%s) DatabaseError occurred when accessing measurement_information_table" % self.filename)
+                        logger.debug(e)
+                        info = {}
 
-            if 'rdy_info_age' in info and len(info['rdy_info_age']) > 0:
-                self.rdy_info_age = info['rdy_info_age'].iloc[-1]
-
-            if 'rdy_info_height' in info and len(info['rdy_info_height']) > 0:
-                self.rdy_info_height = info['rdy_info_height'].iloc[-1]
-
-            if 'rdy_info_weight' in info and len(info['rdy_info_weight']) > 0:
-                self.rdy_info_weight = info['rdy_info_weight'].iloc[-1]
-
-            if 't0' in info and len(info['t0']) > 0:
-                if self.strip_timezone:
-                    t0 = datetime.datetime.fromisoformat(info['t0'].iloc[-1]).replace(tzinfo=None)
-                    self.t0 = np.datetime64(t0)
-                else:
-                    self.t0 = np.datetime64(info['t0'].iloc[-1])
-
-            if 'cs_matrix_string' in info and len(info['cs_matrix_string']) > 0:
-                self.cs_matrix_string = info['cs_matrix_string'].iloc[-1]
-
-            if 'timestamp_when_started' and len(info['timestamp_when_started']) > 0:
-                self.timestamp_when_started = info['timestamp_when_started'].iloc[-1]
-
-            if 'timestamp_when_stopped' in info and len(info['timestamp_when_stopped']) > 0:
-                self.timestamp_when_stopped = info['timestamp_when_stopped'].iloc[-1]
-
-            if 'ntp_timestamp' in info and len(info['ntp_timestamp']) > 0:
-                self.ntp_timestamp = info['ntp_timestamp'].iloc[-1]
-
-            if 'ntp_date_time' in info and len(info['ntp_date_time']) > 0:
-                if self.strip_timezone:
-                    ntp_datetime_str = info['ntp_date_time'].iloc[-1]
-                    if ntp_datetime_str:
-                        ntp_date_time = datetime.datetime.fromisoformat(ntp_datetime_str).replace(tzinfo=None)
-                        self.ntp_date_time = np.datetime64(ntp_date_time)
-                    else:
-                        self.ntp_date_time = None
-                else:
-                    self.ntp_date_time = np.datetime64(info['ntp_date_time'].iloc[-1])
-
-            # Measurements
-            if (self._series is not None and AccelerationSeries in self._series) or self._series is None:
-                try:
-                    acc_df = pd.read_sql_query("SELECT * from acc_measurements_table", db_con)
-                    self.measurements[AccelerationSeries] = \
-                        AccelerationSeries(filename=self.filename,
-                                           rdy_format_version=self.rdy_format_version,
-                                           **dict(acc_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug("(%s) DatabaseError occurred when accessing acc_measurements_table" % self.filename)
-                    logger.debug(e)
-
-            if (self._series is not None and AccelerationUncalibratedSeries in self._series) or self._series is None:
                 try:
-                    acc_uncal_df = pd.read_sql_query("SELECT * from acc_uncal_measurements_table", db_con)
-                    self.measurements[AccelerationUncalibratedSeries] = AccelerationUncalibratedSeries(
-                        filename=self.filename, rdy_format_version=self.rdy_format_version, **dict(acc_uncal_df))
+                    sensor_df = pd.read_sql_query("SELECT * from sensor_descriptions_table", db_con)
+                    for row in sensor_df.to_dict("records"):
+                        self.sensors.append(Sensor(**row))
                 except (DatabaseError, PandasDatabaseError) as e:
                     logger.debug(
-                        "(%s) DatabaseError occurred when accessing acc_uncal_measurements_table" % self.filename)
+                        "(%s) DatabaseError occurred when accessing sensor_descriptions_table" % self.filename)
                     logger.debug(e)
 
-            if (self._series is not None and LinearAccelerationSeries in self._series) or self._series is None:
                 try:
-                    lin_acc_df = pd.read_sql_query("SELECT * from lin_acc_measurements_table", db_con)
-                    self.measurements[LinearAccelerationSeries] = LinearAccelerationSeries(
-                        filename=self.filename,
-                        rdy_format_version=self.rdy_format_version,
-                        **dict(lin_acc_df))
+                    device_df = pd.read_sql_query("SELECT * from device_information_table", db_con)
+                    self.device = Device(**_cols(device_df))
                 except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug(
-                        "(%s) DatabaseError occurred when accessing lin_acc_measurements_table" % self.filename)
+                    logger.debug("(%s) DatabaseError occurred when accessing device_information_table" % self.filename)
                     logger.debug(e)
+                    self.device = Device()
 
-            if (self._series is not None and MagnetometerSeries in self._series) or self._series is None:
-                try:
-                    mag_df = pd.read_sql_query("SELECT * from mag_measurements_table", db_con)
-                    self.measurements[MagnetometerSeries] = MagnetometerSeries(filename=self.filename,
-                                                                               rdy_format_version=self.rdy_format_version,
-                                                                               **dict(mag_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug("(%s) DatabaseError occurred when accessing mag_measurements_table" % self.filename)
-                    logger.debug(e)
+                # Info
+                if 'ridy_version' in info and len(info['ridy_version']) > 1:
+                    logger.debug("Measurement information table contains more than 1 row!")
 
-            if (self._series is not None and MagnetometerUncalibratedSeries in self._series) or self._series is None:
-                try:
-                    mag_uncal_df = pd.read_sql_query("SELECT * from mag_uncal_measurements_table", db_con)
-                    self.measurements[MagnetometerUncalibratedSeries] = MagnetometerUncalibratedSeries(
-                        filename=self.filename, rdy_format_version=self.rdy_format_version, **dict(mag_uncal_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug(
-                        "(%s) DatabaseError occurred when accessing mag_uncal_measurements_table" % self.filename)
-                    logger.debug(e)
+                if 'ridy_version' in info and len(info['ridy_version']) > 0:
+                    self.ridy_version = info['ridy_version'][-1]
 
-            if (self._series is not None and OrientationSeries in self._series) or self._series is None:
-                try:
-                    orient_df = pd.read_sql_query("SELECT * from orient_measurements_table", db_con)
-                    self.measurements[OrientationSeries] = OrientationSeries(filename=self.filename,
-                                                                             rdy_format_version=self.rdy_format_version,
-                                                                             **dict(orient_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug(
-                        "(%s) DatabaseError occurred when accessing orient_measurements_table" % self.filename)
-                    logger.debug(e)
+                if 'ridy_version_code' in info and len(info['ridy_version_code']) > 0:
+                    self.ridy_version_code = info['ridy_version_code'][-1]
 
-            if (self._series is not None and GyroSeries in self._series) or self._series is None:
-                try:
-                    gyro_df = pd.read_sql_query("SELECT * from gyro_measurements_table", db_con)
-                    self.measurements[GyroSeries] = GyroSeries(filename=self.filename,
-                                                               rdy_format_version=self.rdy_format_version,
-                                                               **dict(gyro_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug("(%s) DatabaseError occurred when accessing gyro_measurements_table" % self.filename)
-                    logger.debug(e)
+                if 'rdy_format_version' in info and len(info['rdy_format_version']) > 0:
+                    self.rdy_format_version = info['rdy_format_version'][-1]
 
-            if (self._series is not None and GyroUncalibratedSeries in self._series) or self._series is None:
-                try:
-                    gyro_uncal_df = pd.read_sql_query("SELECT * from gyro_uncal_measurements_table", db_con)
-                    self.measurements[GyroUncalibratedSeries] = GyroUncalibratedSeries(
-                        filename=self.filename, rdy_format_version=self.rdy_format_version, **dict(gyro_uncal_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug(
-                        "(%s) DatabaseError occurred when accessing gyro_uncal_measurements_table" % self.filename)
-                    logger.debug(e)
-
-            if (self._series is not None and RotationSeries in self._series) or self._series is None:
-                try:
-                    rot_df = pd.read_sql_query("SELECT * from rot_measurements_table", db_con)
-                    self.measurements[RotationSeries] = RotationSeries(filename=self.filename,
-                                                                       rdy_format_version=self.rdy_format_version,
-                                                                       **dict(rot_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug("(%s) DatabaseError occurred when accessing rot_measurements_table" % self.filename)
-                    logger.debug(e)
+                if 'rdy_info_name' in info and len(info['rdy_info_name']) > 0:
+                    self.rdy_info_name = info['rdy_info_name'][-1]
 
-            if (self._series is not None and GPSSeries in self._series) or self._series is None:
-                try:
-                    gps_df = pd.read_sql_query("SELECT * from gps_measurements_table", db_con)
-                    self.measurements[GPSSeries] = GPSSeries(filename=self.filename,
-                                                             rdy_format_version=self.rdy_format_version,
-                                                             **dict(gps_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug("(%s) DatabaseError occurred when accessing gps_measurements_table" % self.filename)
-                    logger.debug(e)
+                if 'rdy_info_sex' in info and len(info['rdy_info_sex']) > 0:
+                    self.rdy_info_sex = info['rdy_info_sex'][-1]
 
-            if (self._series is not None and GNSSMeasurementSeries in self._series) or self._series is None:
-                try:
-                    gnss_df = pd.read_sql_query("SELECT * from gnss_measurement_table", db_con)
-                    self.measurements[GNSSMeasurementSeries] = GNSSMeasurementSeries(
-                        filename=self.filename, rdy_format_version=self.rdy_format_version, **dict(gnss_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug("(%s) DatabaseError occurred when accessing gnss_measurement_table" % self.filename)
-                    logger.debug(e)
+                if 'rdy_info_age' in info and len(info['rdy_info_age']) > 0:
+                    self.rdy_info_age = info['rdy_info_age'][-1]
 
-            if (self._series is not None and GNSSClockMeasurementSeries in self._series) or self._series is None:
-                try:
-                    gnss_clock_df = pd.read_sql_query("SELECT * from gnss_clock_measurement_table", db_con)
-                    self.measurements[GNSSClockMeasurementSeries] = GNSSClockMeasurementSeries(
-                        filename=self.filename, rdy_format_version=self.rdy_format_version, **dict(gnss_clock_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug(
-                        "(%s) DatabaseError occurred when accessing gnss_clock_measurement_table" % self.filename)
-                    logger.debug(e)
-
-            if (self._series is not None and NMEAMessageSeries in self._series) or self._series is None:
-                try:
-                    nmea_df = pd.read_sql_query("SELECT * from nmea_messages_table", db_con)
-                    self.measurements[NMEAMessageSeries] = NMEAMessageSeries(
-                        filename=self.filename, rdy_format_version=self.rdy_format_version, **dict(nmea_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug("(%s) DatabaseError occurred when accessing nmea_messages_table" % self.filename)
-                    logger.debug(e)
-
-            if (self._series is not None and PressureSeries in self._series) or self._series is None:
-                try:
-                    pressure_df = pd.read_sql_query("SELECT * from pressure_measurements_table", db_con)
-                    self.measurements[PressureSeries] = PressureSeries(filename=self.filename,
-                                                                       rdy_format_version=self.rdy_format_version,
-                                                                       **dict(pressure_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug(
-                        "(%s) DatabaseError occurred when accessing pressure_measurements_table" % self.filename)
-                    logger.debug(e)
-
-            if (self._series is not None and TemperatureSeries in self._series) or self._series is None:
-                try:
-                    temperature_df = pd.read_sql_query("SELECT * from temperature_measurements_table", db_con)
-                    self.measurements[TemperatureSeries] = TemperatureSeries(filename=self.filename,
-                                                                             rdy_format_version=self.rdy_format_version,
-                                                                             **dict(temperature_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug(
-                        "(%s) DatabaseError occurred when accessing temperature_measurements_table" % self.filename)
-                    logger.debug(e)
+                if 'rdy_info_height' in info and len(info['rdy_info_height']) > 0:
+                    self.rdy_info_height = info['rdy_info_height'][-1]
 
-            if (self._series is not None and HumiditySeries in self._series) or self._series is None:
-                try:
-                    humidity_df = pd.read_sql_query("SELECT * from humidity_measurements_table", db_con)
-                    self.measurements[HumiditySeries] = HumiditySeries(filename=self.filename,
-                                                                       rdy_format_version=self.rdy_format_version,
-                                                                       **dict(humidity_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug(
-                        "(%s) DatabaseError occurred when accessing humidity_measurements_table" % self.filename)
-                    logger.debug(e)
+                if 'rdy_info_weight' in info and len(info['rdy_info_weight']) > 0:
+                    self.rdy_info_weight = info['rdy_info_weight'][-1]
 
-            if (self._series is not None and LightSeries in self._series) or self._series is None:
-                try:
-                    light_df = pd.read_sql_query("SELECT * from light_measurements_table", db_con)
-                    self.measurements[LightSeries] = LightSeries(filename=self.filename,
-                                                                 rdy_format_version=self.rdy_format_version,
-                                                                 **dict(light_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug("(%s) DatabaseError occurred when accessing light_measurements_table" % self.filename)
-                    logger.debug(e)
+                if 't0' in info and len(info['t0']) > 0:
+                    if self.strip_timezone:
+                        t0 = datetime.datetime.fromisoformat(info['t0'][-1]).replace(tzinfo=None)
+                        self.t0 = np.datetime64(t0)
+                    else:
+                        self.t0 = np.datetime64(info['t0'][-1])
 
-            if (self._series is not None and WzSeries in self._series) or self._series is None:
-                try:
-                    wz_df = pd.read_sql_query("SELECT * from wz_measurements_table", db_con)
-                    self.measurements[WzSeries] = WzSeries(filename=self.filename,
-                                                           rdy_format_version=self.rdy_format_version,
-                                                           **dict(wz_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug("(%s) DatabaseError occurred when accessing wz_measurements_table" % self.filename)
-                    logger.debug(e)
+                if 'cs_matrix_string' in info and len(info['cs_matrix_string']) > 0:
+                    self.cs_matrix_string = info['cs_matrix_string'][-1]
 
-            if (self._series is not None and SubjectiveComfortSeries in self._series) or self._series is None:
-                try:
-                    subjective_comfort_df = pd.read_sql_query("SELECT * from subjective_comfort_measurements_table",
-                                                              db_con)
-                    self.measurements[SubjectiveComfortSeries] = SubjectiveComfortSeries(
-                        filename=self.filename,
-                        rdy_format_version=self.rdy_format_version,
-                        **dict(subjective_comfort_df))
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug(
-                        "(%s) DatabaseError occurred when accessing subjective_comfort_measurements_table" % self.filename)
-                    logger.debug(e)
+                if 'timestamp_when_started' and len(info['timestamp_when_started']) > 0:
+                    self.timestamp_when_started = info['timestamp_when_started'][-1]
 
-            if (self._series is not None and NTPDatetimeSeries in self._series) or self._series is None:
-                try:
-                    ntp_datetime_df = pd.read_sql_query("SELECT * from ntp_measurements_table", db_con)
-                    self.measurements[NTPDatetimeSeries] = NTPDatetimeSeries(
-                        filename=self.filename,
-                        rdy_format_version=self.rdy_format_version,
-                        strip_timezone=self.strip_timezone,
-                        **dict(ntp_datetime_df))
+                if 'timestamp_when_stopped' in info and len(info['timestamp_when_stopped']) > 0:
+                    self.timestamp_when_stopped = info['timestamp_when_stopped'][-1]
 
-                except (DatabaseError, PandasDatabaseError) as e:
-                    logger.debug(
-                        "(%s) DatabaseError occurred when accessing subjective_comfort_measurements_table" % self.filename)
-                    logger.debug(e)
+                if 'ntp_timestamp' in info and len(info['ntp_timestamp']) > 0:
+                    self.ntp_timestamp = info['ntp_timestamp'][-1]
 
-            db_con.close()
+                if 'ntp_date_time' in info and len(info['ntp_date_time']) > 0:
+                    if self.strip_timezone:
+                        ntp_datetime_str = info['ntp_date_time'][-1]
+                        if ntp_datetime_str:
+                            ntp_date_time = datetime.datetime.fromisoformat(ntp_datetime_str).replace(tzinfo=None)
+                            self.ntp_date_time = np.datetime64(ntp_date_time)
+                        else:
+                            self.ntp_date_time = None
+                    else:
+                        self.ntp_date_time = np.datetime64(info['ntp_date_time'][-1])
+
+                # Measurements, tables are read one after another so that the temporaries of a table are released
+                # before the next table is read
+                for series_type, table in _SQLITE_MEASUREMENT_TABLES.items():
+                    if (self._series is not None and series_type in self._series) or self._series is None:
+                        try:
+                            cols = _read_sql_columns(db_con, table)
+                        except (DatabaseError, PandasDatabaseError) as e:
+                            logger.debug("(%s) DatabaseError occurred when accessing %s" % (self.filename, table))
+                            logger.debug(e)
+                            continue
+
+                        if series_type == NTPDatetimeSeries:
+                            cols["strip_timezone"] = self.strip_timezone
+
+                        self.measurements[series_type] = series_type(filename=self.filename,
+                                                                     rdy_format_version=self.rdy_format_version,
+                                                                     **cols)
+                        del cols
 
         else:
             raise ValueError("File extension %s is not supported" % self.extension)
@@ -1202,31 +1182,17 @@ class RDYFile:
         Returns
         -------
             pd.DataFrame
+                Averaged samples of all series indexed by time. Columns of empty series and the original timestamps
+                (_time) are contained for sqlite and rdy files alike. Earlier versions dropped them for sqlite files,
+                since empty sqlite tables were read as object columns
         """
-        data_frames = [series.to_df() for series in self.measurements.values()]
+        series = list(self.measurements.values())
+        if not series:
+            return pd.DataFrame()
 
-        # Concatenate dataframes and resort them ascending
-        df_merged = pd.concat(data_frames).sort_index()
+        # Merge the sorted series and average identical indices, then interpolate NaN values
+        df_merged = series[0].merge_sorted(*series[1:])
 
-        # Merge identical indices by taking mean of column values and then interpolate NaN values
         if interpolate:
-            df_merged = df_merged.groupby(level=0).mean().interpolate()
-        else:
-            df_merged = df_merged.groupby(level=0).mean()
+            df_merged = df_merged.interpolate()
         return df_merged
-
-
-class FileIterator:
-    def __init__(self, file: RDYFile):
-        self._file = file
-        self._series_types = list(self._file.measurements.keys())
-        self._index = 0
-
-    def __next__(self):
-        if self._index < len(self._series_types):
-            series_type = self._series_types[self._index]
-
-            self._index += 1
-            return self._file.measurements[series_type]
-        else:
-            raise StopIteration
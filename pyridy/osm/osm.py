@@ -2,7 +2,6 @@ import itertools
 import logging.config
 import math
 import re
-import socket
 import time
 from itertools import chain
 from typing import List, Union
@@ -11,9 +10,12 @@ import networkx as nx
 import numpy as np
 import overpy
 import pyproj
+import requests
 from heapdict import heapdict
 from overpy import Result
+from requests.adapters import HTTPAdapter
 from tqdm.auto import tqdm
+from urllib3.util.retry import Retry
 
 from pyridy import config
 from pyridy.osm.utils import QueryResult, OSMLevelCrossing, OSMRailwaySwitch, OSMRailwaySignal, OSMRailwayLine, \
@@ -31,8 +33,55 @@ def upsample_way(self, res: float = config.options["TRACK_RESOLUTION"]):
 overpy.Way.upsample_way = upsample_way
 
 
+# Error messages in the HTML body of an Overpass response to a bad request (400), extracted like in overpy
+_OVERPASS_ERROR_MSG = re.compile(br"\<p\>(?P<msg>\<strong\s.*?)\</p\>")
+_HTML_TAG = re.compile(b"<[^>]*?>")
+
+
+def _extract_overpass_errors(content: bytes) -> List[str]:
+    """ Extracts the error messages from the response of an Overpass instance to a bad request
+
+    Parameters
+    ----------
+    content: bytes
+        Body of the response
+
+    Returns
+    -------
+    list
+        Error messages
+    """
+    msgs = []
+    for msg in _OVERPASS_ERROR_MSG.finditer(content):
+        msg = _HTML_TAG.sub(b"", msg.group("msg"))
+        try:
+            msgs.append(msg.decode("utf-8"))
+        except UnicodeDecodeError:
+            msgs.append(repr(msg))
+
+    return msgs
+
+
+def _create_http_session() -> requests.Session:
+    """ Creates a HTTP session that retries rate limited (429) and timed out (502, 504) Overpass requests with
+    exponential backoff and reuses connections across queries
+
+    Returns
+    -------
+    requests.Session
+    """
+    retry = Retry(total=5, backoff_factor=1.5, status_forcelist=[429, 502, 504], allowed_methods=["GET", "POST"])
+    adapter = HTTPAdapter(max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 class OSM:
     supported_railway_types = ["rail", "tram", "subway", "light_rail"]
+    _http_session = None  # Shared by all instances, created on the first query, see _get_http_session
 
     def __init__(self, bbox: List[Union[List, float, np.float64]],
                  desired_railway_types: Union[List, str] = None,
@@ -279,13 +328,10 @@ class OSM:
                         pass
 
             for rel in self.relations:
-                rel_way_ids = [mem.ref for mem in rel.members if type(mem) == overpy.RelationWay and not mem.role]
-                rel_ways = [w for w in self.ways if w.id in rel_way_ids]
-
-                sort_order = {w_id: idx for w_id, idx in zip(rel_way_ids, range(len(rel_way_ids)))}
-                rel_ways.sort(key=lambda way: sort_order[way.id])
-
-                # rel_ways = [self.way_dict[rel_id] for rel_id in rel_way_ids]
+                # Ordered set of the way ids, ways are looked up by id instead of scanning all ways per relation
+                rel_way_ids = dict.fromkeys(mem.ref for mem in rel.members
+                                            if type(mem) == overpy.RelationWay and not mem.role)
+                rel_ways = [self.way_dict[w_id] for w_id in rel_way_ids if w_id in self.way_dict]
 
                 railway_line = OSMRailwayLine(relation=rel, ways=rel_ways)
                 if railway_line not in self.railway_lines:
@@ -293,69 +339,80 @@ class OSM:
         else:
             logger.warning("Could not download OSM data because of no internet connection!")
 
+    @classmethod
+    def _get_http_session(cls) -> requests.Session:
+        """ Returns the HTTP session shared by all OSM instances, which is created on first use so that importing the
+        module does not set up a session
+
+        Returns
+        -------
+        requests.Session
+        """
+        if OSM._http_session is None:
+            OSM._http_session = _create_http_session()
+
+        return OSM._http_session
+
     def query_overpass(self, query: str, attempts: int = None) -> Result:
+        """ Queries the given Overpass QL query. The IFS internal Overpass instance is tried first (if reachable),
+        followed by the default and the alternative instance. Rate limits (429) and gateway errors (502, 504) are
+        retried with exponential backoff by the shared HTTP session, which also keeps connections alive between
+        queries.
+
+        Parameters
+        ----------
+        query: str
+            Overpass QL query
+        attempts: int, default: None
+            Number of attempts per Overpass instance in case the query fails because of a runtime error. If None,
+            the OSM_RETRIES option of the config is used
+
+        Returns
+        -------
+        overpy.Result
+            Result of the query or None if the query failed on all Overpass instances or was rejected as a bad request
+        """
         if attempts is None:
             attempts = config.options["OSM_RETRIES"]
 
+        instances = [("Default", self.overpass_api), ("Alternative", self.overpass_api_alt)]
         if internet(host="134.130.76.80", port=12345):  # IFS internal Overpass instance
+            instances.insert(0, ("IFS", self.overpass_api_ifs))
+
+        for name, api in instances:
             for a in range(attempts):
                 time.sleep(a)
                 try:
                     logger.debug("Trying to query OSM data, %d/%d tries" % (a, attempts))
-                    result = self.overpass_api_ifs.query(query)
-                    logger.debug("Successfully queried OSM Data using IFS Overpass instance")
+                    response = self._get_http_session().post(api.url, data=query.encode("utf-8"),
+                                                             timeout=config.options["SOCKET_TIMEOUT"])
+                    if response.status_code == 400:
+                        # The query itself is malformed, so other instances would reject it as well
+                        e = overpy.exception.OverpassBadRequest(query, msgs=_extract_overpass_errors(response.content))
+                        logger.warning("%s (%s Overpass instance): %s" % (type(e).__name__, name, e))
+                        return None
+
+                    response.raise_for_status()
+
+                    content_type = response.headers.get("Content-Type")
+                    if content_type == "application/json":
+                        result = api.parse_json(response.content)
+                    elif content_type == "application/osm3s+xml":
+                        result = api.parse_xml(response.content)
+                    else:
+                        raise overpy.exception.OverpassUnknownContentType(content_type)
+
+                    logger.debug("Successfully queried OSM Data using %s Overpass instance" % name)
                     return result
-                except overpy.exception.OverpassTooManyRequests as e:
-                    logger.warning("OverpassTooManyRequest (IFS Overpass instance), retrying".format(e))
-                except overpy.exception.OverpassRuntimeError as e:
-                    logger.warning("OverpassRuntimeError (IFS Overpass instance), retrying".format(e))
-                except overpy.exception.OverpassGatewayTimeout as e:
-                    logger.warning("OverpassTooManyRequest (IFS Overpass instance), retrying".format(e))
-                except overpy.exception.OverpassBadRequest as e:
-                    logger.warning("OverpassTooManyRequest (IFS Overpass instance), retrying".format(e))
-                except socket.timeout as e:
-                    logger.warning("Socket timeout (IFS Overpass instance), retrying".format(e))
-
-        for a in range(attempts):  # Default Overpass instance
-            time.sleep(a)
-            try:
-                logger.debug("Trying to query OSM data, %d/%d tries" % (a, attempts))
-                result = self.overpass_api.query(query)
-                logger.debug("Successfully queried OSM Data using default Overpass instance")
-                return result
-            except overpy.exception.OverpassTooManyRequests as e:
-                logger.warning("OverpassTooManyRequest (Default Overpass instance), retrying".format(e))
-            except overpy.exception.OverpassRuntimeError as e:
-                logger.warning("OverpassRuntimeError (Default Overpass instance), retrying".format(e))
-            except overpy.exception.OverpassGatewayTimeout as e:
-                logger.warning("OverpassTooManyRequest (Default Overpass instance), retrying".format(e))
-            except overpy.exception.OverpassBadRequest as e:
-                logger.warning("OverpassTooManyRequest (Default Overpass instance), retrying".format(e))
-            except socket.timeout as e:
-                logger.warning("Socket timeout (Default Overpass instance), retrying".format(e))
-
-        logger.debug("Using alternative Overpass API url")
-        for a in range(attempts):
-            time.sleep(a)
-            try:
-                logger.debug("Trying to query OSM data, %d/%d tries" % (a, attempts))
-                result = self.overpass_api_alt.query(query)
-                logger.debug("Successfully queried OSM Data using alternative instance")
-                return result
-            except overpy.exception.OverpassTooManyRequests as e:
-                logger.warning("OverpassTooManyRequest (Alternative Overpass instance), retrying".format(e))
-            except overpy.exception.OverpassRuntimeError as e:
-                logger.warning("OverpassRuntimeError (Alternative Overpass instance), retrying".format(e))
-            except overpy.exception.OverpassGatewayTimeout as e:
-                logger.warning("OverpassTooManyRequest (Alternative Overpass instance), retrying".format(e))
-            except overpy.exception.OverpassBadRequest as e:
-                logger.warning("OverpassTooManyRequest (Alternative Overpass instance), retrying".format(e))
-            except socket.timeout as e:
-                logger.warning("Socket timeout (Alternative Overpass instance), retrying".format(e))
-        else:
-            logger.warning("Could download OSM data via Overpass after %d attempts with query: %s" % (attempts,
-                                                                                                      query))
-            return None
+                except overpy.exception.OverPyException as e:
+                    logger.warning("%s (%s Overpass instance), retrying: %s" % (type(e).__name__, name, e))
+                except requests.exceptions.RequestException as e:
+                    # Retries with backoff are already exhausted by the session, continue with the next instance
+                    logger.warning("Request failed (%s Overpass instance): %s" % (name, e))
+                    break
+
+        logger.warning("Could download OSM data via Overpass after %d attempts with query: %s" % (attempts, query))
+        return None
 
     def get_all_route_nodes(self) -> list:
         """ Retrieves a list of nodes part of any relation/route
@@ -1,20 +1,42 @@
 import itertools
 import logging
 from abc import ABC
-from typing import List
+from typing import List, TYPE_CHECKING
 
 import networkx as nx
+import numpy as np
 import overpy
-from ipyleaflet import Map, ScaleControl, FullScreenControl, Polyline, Circle, LayerGroup
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra, connected_components
 
 from pyridy import config
-from pyridy.osm.utils import convert_lon_lat_to_xy, calc_curvature, calc_distance_from_lon_lat
-from pyridy.utils.tools import generate_random_color
+from pyridy.osm.utils import calc_curvature, calc_xy_and_distance_from_lon_lat
+from pyridy.utils.tools import generate_random_color, create_result_layer, create_base_map
+
+if TYPE_CHECKING:
+    from ipyleaflet import Map
 
 logger = logging.getLogger(__name__)
 
 
+def _cache_coords(nodes: List[overpy.Node]):
+    """ Stores the coordinates of the nodes as floats (_lonf, _latf), so that the Decimal coordinates of overpy are
+    converted only once per node
+
+    Parameters
+    ----------
+    nodes: List[overpy.Node]
+        Nodes whose coordinates should be cached
+    """
+    for n in nodes:
+        if "_lonf" not in n.__dict__:
+            n._lonf = float(n.lon)
+            n._latf = float(n.lat)
+
+
 class OSMResultNode:
+    __slots__ = ("lat", "lon", "value", "f", "proc", "dir", "color")
+
     def __init__(self, lon: float, lat: float,
                  value=None, f=None, proc=None, dir: str = "", color: str = None):
         """ Class representing a Node calculated by PyRidy
@@ -49,6 +71,8 @@ class OSMResultWay:
 
 
 class OSMRailwayElement(ABC):
+    __slots__ = ("n", "attributes", "tags", "lat", "lon", "id", "ways")
+
     def __init__(self, n: overpy.Node):
         """ Abstract Base Class for railway elements retrieved from OpenStreetMap
 
@@ -60,8 +84,9 @@ class OSMRailwayElement(ABC):
         self.n = n
         self.attributes = n.attributes
         self.tags = n.tags
-        self.lat = float(n.lat)
-        self.lon = float(n.lon)
+        _cache_coords([n])
+        self.lat = n._latf
+        self.lon = n._lonf
         self.id = n.id
 
         if hasattr(n, "ways"):
@@ -69,10 +94,20 @@ class OSMRailwayElement(ABC):
         else:
             self.ways = None
 
-        self.__dict__.update(n.tags)  # Different elements contain different tags
+    def __getattr__(self, name):
+        # Different elements contain different tags, make them accessible as attributes, e.g. signal.ref
+        if name.startswith("__") or name == "tags":
+            raise AttributeError(name)
+
+        try:
+            return self.tags[name]
+        except KeyError:
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
 
 
 class OSMLevelCrossing(OSMRailwayElement):
+    __slots__ = ()
+
     def __init__(self, n: overpy.Node):
         """ Class representing railway level crossings
 
@@ -90,6 +125,8 @@ class OSMLevelCrossing(OSMRailwayElement):
 
 
 class OSMRailwayMilestone(OSMRailwayElement):
+    __slots__ = ("position", "addition")
+
     def __init__(self, n: overpy.Node):
         """ Class representing railway milestones (turnouts)
 
@@ -114,6 +151,8 @@ class OSMRailwayMilestone(OSMRailwayElement):
 
 
 class OSMRailwaySignal(OSMRailwayElement):
+    __slots__ = ()
+
     def __init__(self, n: overpy.Node):
         """ Class representing railway signals
 
@@ -131,6 +170,8 @@ class OSMRailwaySignal(OSMRailwayElement):
 
 
 class OSMRailwaySwitch(OSMRailwayElement):
+    __slots__ = ("allowed_transits",)
+
     def __init__(self, n: overpy.Node):
         """ Class representing railway switches (turnouts)
 
@@ -147,6 +188,9 @@ class OSMRailwaySwitch(OSMRailwayElement):
 
 
 class OSMRelation:
+    __slots__ = ("id", "relation", "name", "ways", "nodes", "G", "endpoints", "tracks", "color", "lon_sw", "lon_ne",
+                 "lat_sw", "lat_ne")
+
     def __init__(self, relation: overpy.Relation, ways=None, color=None):
         """ Class Representing an OpenStreetMap relation. A relation can represent multiple tracks in some cases
 
@@ -167,44 +211,80 @@ class OSMRelation:
         self.relation = relation
         self.name = relation.tags.get("name", "")
         self.ways = ways
-        self.way_nodes = [way.nodes for way in self.ways]  # List of list of nodes
-        self.nodes = list(itertools.chain.from_iterable(self.way_nodes)) if self.way_nodes else None  # list of nodes
+        # Nodes shared by adjacent ways are only kept once
+        id_to_node = {n.id: n for n in itertools.chain.from_iterable(way.nodes for way in self.ways)}
+        self.nodes = list(id_to_node.values()) if self.ways else None  # list of nodes
+        _cache_coords(self.nodes)
+        id_to_idx = {n_id: idx for idx, n_id in enumerate(id_to_node)}
+
+        # Coordinates of all nodes are converted only once
+        lons = np.fromiter((n._lonf for n in self.nodes), dtype=np.float64, count=len(self.nodes))
+        lats = np.fromiter((n._latf for n in self.nodes), dtype=np.float64, count=len(self.nodes))
+
+        # Edges have geodesic distances as edge weights, of parallel edges only the shortest one is kept
+        edge_dict = {}  # (node index, node index) -> (d, way id)
+        for w in self.ways:
+            w_idxs = np.fromiter((id_to_idx[n.id] for n in w.nodes), dtype=np.intp, count=len(w.nodes))
+            w_lons, w_lats = lons[w_idxs], lats[w_idxs]
 
-        self.G = nx.MultiGraph()
-        self.G.add_nodes_from([(n.id, n.__dict__) for n in self.nodes])
+            # Distances are computed for the whole way at once
+            dists = config.geod.inv(w_lons[:-1], w_lats[:-1], w_lons[1:], w_lats[1:])[2]
+            for i1, i2, d in zip(w_idxs.tolist(), w_idxs[1:].tolist(), dists.tolist()):
+                key = (i1, i2) if i1 <= i2 else (i2, i1)
+                if key not in edge_dict or d < edge_dict[key][0]:
+                    edge_dict[key] = (d, w.id)
 
-        # Add edges
-        for w in self.ways:
-            edges = [(n1.id, n2.id, config.geod.inv(float(n1.lon), float(n1.lat), float(n2.lon), float(n2.lat))[2])
-                     for n1, n2 in zip(w.nodes, w.nodes[1:])]  # Edges have geodesic distances as edge weights
-            self.G.add_weighted_edges_from(edges, weight="d", way_id=w.id)
+        self.G = nx.Graph()
+        self.G.add_nodes_from([(n.id, n.__dict__) for n in self.nodes])
+        self.G.add_edges_from((self.nodes[i1].id, self.nodes[i2].id, {"d": d, "way_id": w_id})
+                              for (i1, i2), (d, w_id) in edge_dict.items())
 
         # Look up endpoints
-        self.endpoints = []  # Node IDs of endpoints
-        for n in self.G.nodes:
-            if len(self.G.adj[n]) == 1:
-                self.endpoints.append(n)
+        self.endpoints = [n for n, deg in self.G.degree() if deg == 1]  # Node IDs of endpoints
 
         # Search tracks within relation (double tracks have 2 physical tracks but 4 tracks are found through Graph
         # search since each track can be trafficked in both directions)
         self.tracks = []
 
-        for s, t in itertools.combinations(self.endpoints, 2):
-            try:
-                sp_n = nx.shortest_path(self.G, source=s, target=t)  # List of node ids that make up shortest path
-                nodes = [next(n for n in self.nodes if n.id == n_id) for n_id in sp_n]
-                ways = list(set(list(itertools.chain.from_iterable([n.ways for n in nodes]))))
-                self.tracks.append(OSMTrack(nodes, ways))
-            except nx.NetworkXNoPath as e:
-                logger.debug(e)
+        if len(self.endpoints) > 1:
+            # Shortest paths are computed by scipy's compiled Dijkstra on a sparse adjacency matrix of the graph, one
+            # run per endpoint yields the paths to all remaining endpoints
+            rows, cols = zip(*edge_dict.keys()) if edge_dict else ((), ())
+            adj = csr_matrix(([d for d, _ in edge_dict.values()], (rows, cols)),
+                             shape=(len(self.nodes), len(self.nodes)))
+
+            ep_idxs = [id_to_idx[n_id] for n_id in self.endpoints]
+
+            # Only endpoints within the same connected component can be connected by a track. Dijkstra is run only
+            # for endpoints that have a later endpoint in their component
+            _, labels = connected_components(adj, directed=False)
+            ep_labels = labels[ep_idxs]
+            sources = [i for i in range(len(ep_idxs) - 1) if np.any(ep_labels[i + 1:] == ep_labels[i])]
+
+            if sources:
+                _, pred = dijkstra(adj, directed=False, indices=[ep_idxs[i] for i in sources],
+                                   return_predecessors=True)
+
+            for row, i in enumerate(sources):
+                for t_idx, t_label in zip(ep_idxs[i + 1:], ep_labels[i + 1:]):
+                    if t_label != ep_labels[i]:
+                        continue
+
+                    # Walk back the predecessors from target to source
+                    sp_idxs = [t_idx]
+                    while pred[row, sp_idxs[-1]] >= 0:
+                        sp_idxs.append(pred[row, sp_idxs[-1]])
+
+                    nodes = [self.nodes[idx] for idx in reversed(sp_idxs)]
+                    ways = list({w.id: w for n in nodes if n.ways for w in n.ways}.values())
+                    self.tracks.append(OSMTrack(nodes, ways))
 
         logger.debug("Number of individual tracks: %d" % len(self.tracks))
 
-        self.color = relation.tags.get("colour", generate_random_color("HEX")) if not color else color
-        self.lon_sw = min([float(n.lon) for n in self.nodes])
-        self.lon_ne = max([float(n.lon) for n in self.nodes])
-        self.lat_sw = min([float(n.lat) for n in self.nodes])
-        self.lat_ne = max([float(n.lat) for n in self.nodes])
+        # Random color is only generated if neither a color is given nor the relation has a colour tag
+        self.color = color if color else relation.tags.get("colour") or generate_random_color("HEX")
+        self.lon_sw, self.lon_ne = float(lons.min()), float(lons.max())
+        self.lat_sw, self.lat_ne = float(lats.min()), float(lats.max())
 
     def to_ipyleaflef(self) -> List[list]:
         """
@@ -219,41 +299,28 @@ class OSMRelation:
         else:
             return [[]]
 
-    def create_map(self, show_result_nodes: bool = False, use_file_color: bool = False) -> Map:
+    def create_map(self, show_result_nodes: bool = False, use_file_color: bool = False,
+                   grid_decimals: int = None) -> "Map":
         center = ((self.lat_sw + self.lat_ne) / 2, (self.lon_sw + self.lon_ne) / 2)
 
-        m = Map(center=center, zoom=12, scroll_wheel_zoom=True, basemap=config.OPEN_STREET_MAP_DE)
-        m.add_control(ScaleControl(position='bottomleft'))
-        m.add_control(FullScreenControl())
+        from ipyleaflet import Polyline
 
-        # Add map
-        m.add_layer(config.OPEN_RAILWAY_MAP)
+        m = create_base_map(center=center)
 
-        for track in self.tracks:
-            coords = track.to_ipyleaflet()
-            file_polyline = Polyline(locations=coords, color=self.color, fill=False, weight=4)
-            m.add_layer(file_polyline)
+        coords = [track.to_ipyleaflet() for track in self.tracks if len(track.lat) > 0]
+        if coords:
+            m.add_layer(Polyline(locations=coords, color=self.color, fill=False, weight=4))
 
         if show_result_nodes:
-            nodes = list(itertools.chain.from_iterable([w.attributes.get("results", []) for w in self.ways]))
-            circles = []
-            for n in nodes:
-                circle = Circle()
-                circle.location = n.lon, n.lat
-                circle.radius = 2
-                circle.color = n.f.color if use_file_color else n.color
-                circle.fill_color = n.f.color if use_file_color else n.color
-                circle.weight = 3
-                circle.fill_opacity = 0.1
-                circles.append(circle)
-
-            l_circles = LayerGroup(layers=circles)
-            m.add_layer(l_circles)
+            nodes = list(itertools.chain.from_iterable(w.attributes.get("results", ()) for w in self.ways))
+            m.add_layer(create_result_layer(nodes, use_file_color=use_file_color, grid_decimals=grid_decimals))
 
         return m
 
 
 class OSMRailwayLine(OSMRelation):
+    __slots__ = ("tags", "members", "milestones", "results")
+
     def __init__(self, relation: overpy.Relation, ways: List[overpy.Way] = None, color=None):
         """ Class representing a railway line
 
@@ -275,14 +342,28 @@ class OSMRailwayLine(OSMRelation):
         self.tags = relation.tags
 
         self.members = relation.members
+
+        # Nodes of the relation are already unique by id, so every milestone is only created once
         self.milestones = [OSMRailwayMilestone(n) for n in self.nodes if n.tags.get("railway", "") == "milestone"]
         self.results = {}
 
+    def __getattr__(self, name):
+        # Tags are not copied onto the instance, make them accessible as attributes nevertheless, e.g. line.ref
+        if name.startswith("__") or name == "tags":
+            raise AttributeError(name)
+
+        try:
+            return self.tags[name]
+        except KeyError:
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
     def __repr__(self):
-        return self.__dict__.get("name", "")
+        return self.name
 
 
 class OSMTrack:
+    __slots__ = ("lat", "lon", "x", "y", "ds", "s", "c", "_nodes", "ways")
+
     def __init__(self, nodes: List[overpy.Node], ways: List[overpy.Way]):
         """ Represents a single railway track
 
@@ -311,19 +392,21 @@ class OSMTrack:
     @nodes.setter
     def nodes(self, nodes: List[overpy.Node]):
         self._nodes = nodes
+        _cache_coords(nodes)
 
-        self.lon = [float(n.lon) for n in nodes]
-        self.lat = [float(n.lat) for n in nodes]
+        # Single pass over the nodes, all further computations work on the resulting arrays
+        coords = np.fromiter((v for n in nodes for v in (n._lonf, n._latf)), dtype=np.float64,
+                             count=2 * len(nodes)).reshape(-1, 2)
+        self.lon, self.lat = coords[:, 0], coords[:, 1]
 
-        self.x, self.y = convert_lon_lat_to_xy(self.lon, self.lat)
+        self.x, self.y, self.s, self.ds = calc_xy_and_distance_from_lon_lat(self.lon, self.lat)
         self.c = calc_curvature(self.x, self.y)
-        self.s, self.ds = calc_distance_from_lon_lat(self.lon, self.lat)
 
     def flip_curvature(self):
         """
             Flips the calculated curvature upside down
         """
-        self.c = [el * -1 for el in self.c]
+        np.negative(self.c, out=self.c)
 
     def to_ipyleaflet(self):
         """ Converts the coordinates to the format required by ipyleaflet for drawing
@@ -331,8 +414,8 @@ class OSMTrack:
         -------
             list
         """
-        if self.lat and self.lon:
-            return [[float(lat), float(lon)] for lat, lon in zip(self.lat, self.lon)]
+        if len(self.lat) > 0 and len(self.lon) > 0:
+            return np.round(np.column_stack((self.lat, self.lon)), 6).tolist()
         else:
             return [[]]
 
@@ -348,12 +431,12 @@ class OSMTrack:
             list
         """
         if frmt == "lon,lat":
-            if self.lat and self.lon:
-                return [[float(lat), float(lon)] for lat, lon in zip(self.lat, self.lon)]
+            if len(self.lat) > 0 and len(self.lon) > 0:
+                return np.round(np.column_stack((self.lat, self.lon)), 6).tolist()
             else:
                 return [(None, None)]
         elif frmt == "x,y":
-            if self.x and self.y:
+            if len(self.x) > 0 and len(self.y) > 0:
                 return [(x, y) for x, y in zip(self.x, self.y)]
             else:
                 return [(None, None)]
@@ -5,7 +5,6 @@ from typing import Union, List, Tuple
 import numpy as np
 import overpy
 import scipy.interpolate as si
-from numpy.linalg import norm
 from shapely.geometry import LineString
 
 from pyridy import config
@@ -37,69 +36,52 @@ def calc_angle_between(v1: Union[list, np.ndarray], v2: Union[list, np.ndarray])
     return np.arccos(np.clip(np.dot(v1_u, v2_u), -1.0, 1.0))
 
 
-def calc_curvature(x: List[float], y: List[float]) -> List[float]:
+def calc_curvature(x: Union[List[float], np.ndarray], y: Union[List[float], np.ndarray]) -> np.ndarray:
     """ Calculates the Menger curvature for a set of coordinates
 
     Parameters
     ----------
-    x
-    y
+    x: array_like
+    y: array_like
 
     Returns
     -------
-    list
+    np.ndarray
     """
     if len(x) != len(y):
         raise ValueError("x and y have to be same length")
 
     if len(x) > 0 and len(y) > 0:
-        c = [0]
-
-        for i in range(len(x)):
-            if not (i == 0 or i == len(x) - 1):
-                # Get three neighbored points
-                x1 = x[i - 1]
-                y1 = y[i - 1]
-
-                x2 = x[i]
-                y2 = y[i]
-
-                x3 = x[i + 1]
-                y3 = y[i + 1]
-
-                # Get distance between each of the points
-                s_a = math.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)
-                s_b = math.sqrt((x2 - x3) ** 2 + (y2 - y3) ** 2)
-                s_c = math.sqrt((x3 - x1) ** 2 + (y3 - y1) ** 2)
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        c = np.zeros(max(len(x), 2))
 
-                s = (s_a + s_b + s_c) / 2
-                a = s * (s - s_a) * (s - s_b) * (s - s_c)
+        if len(x) > 2:
+            # Differences between neighboring points are computed once and shared by the three-point stencils,
+            # segment i connects point i and i + 1
+            dx, dy = np.diff(x), np.diff(y)
+            seg = np.sqrt(dx ** 2 + dy ** 2)
 
-                if a > 0:
-                    A = math.sqrt(a)
-                else:
-                    A = 0
+            # Get distance between each of the points
+            s_a, s_b = seg[:-1], seg[1:]
+            s_c = np.sqrt((x[2:] - x[:-2]) ** 2 + (y[2:] - y[:-2]) ** 2)
 
-                # Calculate sign
-                dx12 = x2 - x1
-                dy12 = y2 - y1
+            s = (s_a + s_b + s_c) / 2
+            a = s * (s - s_a) * (s - s_b) * (s - s_c)
+            A = np.sqrt(np.where(a > 0, a, 0))
 
-                dx23 = x3 - x2
-                dy23 = y3 - y2
+            # Calculate sign
+            sgn = np.sign(dx[:-1] * dy[1:] - dy[:-1] * dx[1:])
 
-                sgn = np.sign(np.cross([dx12, dy12], [dx23, dy23]))
-
-                # Menger Curvature
+            # Menger Curvature
+            with np.errstate(divide="ignore", invalid="ignore"):
                 res = sgn * 4 * A / (s_a * s_b * s_c)
-                if not math.isnan(res):
-                    c.append(res)
-                else:
-                    c.append(0.0)
+            res[np.isnan(res)] = 0.0
+
+            c[1:-1] = res
 
-        c.append(0)
         return c
     else:
-        return []
+        return np.array([])
 
 
 def calc_distance_from_xy(x: List[float], y: List[float]) -> Tuple[list, list]:
@@ -140,31 +122,29 @@ def calc_distance_from_xy(x: List[float], y: List[float]) -> Tuple[list, list]:
         return [], []
 
 
-def calc_distance_from_lon_lat(lon: List[float], lat: List[float]):
+def calc_distance_from_lon_lat(lon: Union[List[float], np.ndarray], lat: Union[List[float], np.ndarray]):
     """ Computes pairwise and total distance using geodesic distance of individual lat/lon coordinates
 
     Parameters
     ----------
-    lon: list
-    lat: list
+    lon: array_like
+    lat: array_like
 
     Returns
     -------
-    list, list
+    np.ndarray, np.ndarray
     """
     if len(lon) != len(lat):
         raise ValueError("x and y have to be same length")
 
-    if lon and lat:
-        s = [0]
-        ds = []
+    if len(lon) > 0 and len(lat) > 0:
+        lon, lat = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
 
-        for i in range(len(lon)):
-            if i >= 1:
-                ds.append(config.geod.inv(lon[i - 1], lat[i - 1], lon[i], lat[i])[2])
+        # Geodesic distances between all consecutive coordinates in a single call
+        ds = config.geod.inv(lon[:-1], lat[:-1], lon[1:], lat[1:])[2]
 
         # Integrate ds
-        s.extend(np.cumsum(ds))
+        s = np.concatenate(([0.0], np.cumsum(ds)))
 
         return s, ds
     else:
@@ -199,7 +179,7 @@ def convert_lon_lat_to_xy(lon: List[float], lat: List[float], adjust_zero_point:
     -------
     list, list
     """
-    if lon and lat:
+    if len(lon) > 0 and len(lat) > 0:
         x, y = config.proj(lon, lat)
         if adjust_zero_point:
             return [el - x[0] for el in x], [el - y[0] for el in y]
@@ -209,22 +189,49 @@ def convert_lon_lat_to_xy(lon: List[float], lat: List[float], adjust_zero_point:
         return [], []
 
 
-def bspline(cv, n=10000, degree=3, periodic=False):
-    """ Calculate n samples on a bspline
+def calc_xy_and_distance_from_lon_lat(lon: Union[List[float], np.ndarray], lat: Union[List[float], np.ndarray]):
+    """ Combines convert_lon_lat_to_xy and calc_distance_from_lon_lat, the coordinates are converted to arrays only
+    once and shared by the projection and the geodesic distance calculation
+
+    Parameters
+    ----------
+    lon: array_like
+    lat: array_like
+
+    Returns
+    -------
+    np.ndarray, np.ndarray, np.ndarray, np.ndarray
+        x, y, total distance, pairwise distances
+    """
+    if len(lon) != len(lat):
+        raise ValueError("lon and lat have to be same length")
+
+    if len(lon) > 0:
+        lon, lat = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+
+        x, y = config.proj(lon, lat)
+        ds = config.geod.inv(lon[:-1], lat[:-1], lon[1:], lat[1:])[2]
+        s = np.concatenate(([0.0], np.cumsum(ds)))
+
+        return x, y, s, ds
+    else:
+        return [], [], [], []
+
+
+def make_bspline(cv, degree=3, periodic=False) -> si.BSpline:
+    """ Creates a bspline from control vertices that can be sampled repeatedly using sample_bspline
 
         Parameters
         ----------
         cv: array_like
             Array ov control vertices
-        n: int
-            Number of samples to return
         degree: int
             Curve degree
         periodic: bool
             True - Curve is closed, False - Curve is open
         Returns
         -------
-        np.ndarray
+        scipy.interpolate.BSpline
 
         """
 
@@ -245,15 +252,54 @@ def bspline(cv, n=10000, degree=3, periodic=False):
     # Calculate knot vector
     kv = None
     if periodic:
-        kv = np.arange(0 - degree, count + degree + degree - 1, dtype='int')
+        kv = np.arange(0 - degree, count + 1, dtype='int')
     else:
         kv = np.concatenate(([0] * degree, np.arange(count - degree + 1), [count - degree] * degree))
 
-    # Calculate query range
-    u = np.linspace(periodic, (count - degree), n)
+    return si.BSpline(kv.astype(np.float64), cv, int(degree), extrapolate=False)
 
-    # Calculate result
-    return np.array(si.splev(u, (kv, cv.T, degree))).T
+
+def sample_bspline(spline: si.BSpline, n=10000, periodic=False) -> np.ndarray:
+    """ Calculate n samples on a bspline created by make_bspline
+
+        Parameters
+        ----------
+        spline: scipy.interpolate.BSpline
+            Spline created by make_bspline
+        n: int
+            Number of samples to return
+        periodic: bool
+            Must match the periodic argument used to create the spline
+        Returns
+        -------
+        np.ndarray
+
+        """
+    # Calculate query range, the base interval of the spline ends at count - degree
+    u = np.linspace(spline.t[spline.k] + periodic, spline.t[len(spline.c)], n)
+
+    return spline(u)
+
+
+def bspline(cv, n=10000, degree=3, periodic=False):
+    """ Calculate n samples on a bspline
+
+        Parameters
+        ----------
+        cv: array_like
+            Array ov control vertices
+        n: int
+            Number of samples to return
+        degree: int
+            Curve degree
+        periodic: bool
+            True - Curve is closed, False - Curve is open
+        Returns
+        -------
+        np.ndarray
+
+        """
+    return sample_bspline(make_bspline(cv, degree=degree, periodic=periodic), n=n, periodic=periodic)
 
 
 def project_point_onto_line(line: Union[np.ndarray, list], point: Union[np.ndarray, list]) -> tuple:
@@ -272,29 +318,102 @@ def project_point_onto_line(line: Union[np.ndarray, list], point: Union[np.ndarr
         line and secondly the (perpendicular) distance to this point
 
     """
-    if type(line) is list:
-        line = np.array(line)
+    (x1, y1), (x2, y2) = line[0], line[1]
+    x3, y3 = point[0], point[1]
+
+    if x1 == x2 and y1 == y2:
+        raise ValueError("Given line consists of two identical points!")
+
+    # Plain float arithmetic, this function is called for every point during map matching
+    dx, dy = x2 - x1, y2 - y1
+    length = math.sqrt(dx ** 2 + dy ** 2)
 
-    if type(point) is list:
-        point = np.array(point)
+    d = abs(dx * (y1 - y3) - dy * (x1 - x3)) / length
 
-    p1 = line[0]
-    p2 = line[1]
-    p3 = point
+    t = ((x3 - x1) * dx + (y3 - y1) * dy) / length ** 2
+    p = np.array([x1 + t * dx, y1 + t * dy])
+
+    return p, d
+
+
+def project_points_onto_line(line: Union[np.ndarray, list], points: Union[np.ndarray, list]) -> tuple:
+    """ Batch version of project_point_onto_line for many points and a single line
+
+    Parameters
+    ----------
+    line: np.ndarray
+        List of two points defining the line in the form of [[x1, y1],[x2, y2]]
+    points: np.ndarray
+        Array of shape (N, 2) with the points that should be projected onto the line
+    Returns
+    -------
+    tuple
+        Returns a tuple with an array of shape (N, 2) containing the orthogonal projections of the points onto the
+        line and secondly an array with the (perpendicular) distances of the points to the line
+
+    """
+    line = np.asarray(line, dtype=np.float64)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+    p1, p2 = line[0], line[1]
 
     if np.array_equal(p1, p2):
         raise ValueError("Given line consists of two identical points!")
 
-    d = norm(np.cross(p2 - p1, p1 - p3)) / norm(p2 - p1)
+    s = p2 - p1
+    length = math.sqrt(s[0] ** 2 + s[1] ** 2)
+    n = s / length
 
-    n = p2 - p1
-    n = n / norm(n, 2)
+    v = points - p1
 
-    p = p1 + n * np.dot(p3 - p1, n)
+    # 2D cross product of the line direction and the points, written out to avoid np.cross
+    d = np.abs(s[0] * v[:, 1] - s[1] * v[:, 0]) / length
+    p = p1 + np.outer(v @ n, n)
 
     return p, d
 
 
+def project_points_onto_lines(lines: Union[np.ndarray, list], points: Union[np.ndarray, list]) -> tuple:
+    """ Batch version of project_point_onto_line and is_point_within_line_projection for all pairs of many points and
+    many lines
+
+    Parameters
+    ----------
+    lines: np.ndarray
+        Array of shape (M, 2, 2) with the lines, each defined by two points in the form of [[x1, y1],[x2, y2]]
+    points: np.ndarray
+        Array of shape (N, 2) with the points that should be projected onto the lines
+    Returns
+    -------
+    tuple
+        Returns a tuple with an array of shape (N, M, 2) containing the orthogonal projections of the points onto the
+        lines, an array of shape (N, M) with the (perpendicular) distances and a boolean array of shape (N, M)
+        indicating whether the projection falls within the points that define the respective line. Lines consisting
+        of two identical points result in NaN projections and distances
+
+    """
+    lines = np.asarray(lines, dtype=np.float64).reshape(-1, 2, 2)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+    x1, y1 = lines[:, 0, 0], lines[:, 0, 1]
+    dx, dy = lines[:, 1, 0] - x1, lines[:, 1, 1] - y1
+    x3, y3 = points[:, 0, None], points[:, 1, None]
+
+    # Same operations as in the scalar functions, so that results are identical
+    sq_length = dx ** 2 + dy ** 2
+    length = np.sqrt(sq_length)
+    dot = (x3 - x1) * dx + (y3 - y1) * dy
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        d = np.abs(dx * (y1 - y3) - dy * (x1 - x3)) / length
+        t = dot / length ** 2
+
+    p = np.stack((x1 + t * dx, y1 + t * dy), axis=-1)
+    within = (0 <= dot) & (dot <= sq_length)
+
+    return p, d, within
+
+
 def boxes_to_edges(boxes):
     """
     Source: https://stackoverflow.com/questions/4842613/merge-lists-that-share-common-elements
@@ -392,25 +511,19 @@ def is_point_within_line_projection(line: Union[np.ndarray, list], point: Union[
     -------
 
     """
-    if type(line) is list:
-        line = np.array(line)
+    (x1, y1), (x2, y2) = line[0], line[1]
+    x3, y3 = point[0], point[1]
 
-    if type(point) is list:
-        point = np.array(point)
+    sx, sy = x2 - x1, y2 - y1
+    vx, vy = x3 - x1, y3 - y1
 
-    p1 = line[0]
-    p2 = line[1]
-    p3 = point
-
-    s = p2 - p1
-    v = p3 - p1
-
-    b = (0 <= np.inner(v, s) <= np.inner(s, s))
+    b = (0 <= vx * sx + vy * sy <= sx ** 2 + sy ** 2)
 
     return b
 
 
-def haversine(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+def haversine(lon1: float, lat1: float, lon2: float, lat2: float, precomputed_src: Tuple[float, float, float] = None) \
+        -> float:
     """ Calculate the great circle distance in kilometers between two points on the earth (specified in decimal degrees)
         Source:
         https://stackoverflow.com/questions/4913349/haversine-formula-in-python-bearing-and-distance-between-two-gps-points
@@ -421,23 +534,117 @@ def haversine(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
         Longitude of first point
     lat1: float
         Latitude of first point
+    lon2: float or array_like
+        Longitude of second point
+    lat2: float or array_like
+        Latitude of second point
+    precomputed_src: Tuple[float, float, float], default: None
+        Tuple (radians(lon1), radians(lat1), cos(radians(lat1))) of the first point. Can be created once if the
+        distances of many points to the same first point are calculated, lon1 and lat1 are ignored in this case
+    Returns
+    -------
+    float or np.ndarray
+        Distance between the points in meters, an array if any of the coordinates is an array
+
+    """
+    if precomputed_src is not None:
+        if np.isscalar(lon2) and np.isscalar(lat2):
+            return _haversine_precomp(*precomputed_src, lon2, lat2)
+        return _haversine_precomp_vec(*precomputed_src, lon2, lat2)
+
+    if not all(np.isscalar(v) for v in (lon1, lat1, lon2, lat2)):
+        return haversine_vec(lon1, lat1, lon2, lat2)
+
+    # convert decimal degrees to radians
+    lon1_r, lat1_r = radians(lon1), radians(lat1)
+    return _haversine_precomp(lon1_r, lat1_r, cos(lat1_r), lon2, lat2)
+
+
+def _haversine_precomp(lon1_r: float, lat1_r: float, cos_lat1_r: float, lon2: float, lat2: float) -> float:
+    """ Haversine formula with the trigonometry of the first point already done
+
+    Parameters
+    ----------
+    lon1_r: float
+        Longitude of first point in radians
+    lat1_r: float
+        Latitude of first point in radians
+    cos_lat1_r: float
+        Cosine of the latitude of the first point
     lon2: float
         Longitude of second point
     lat2: float
         Latitude of second point
+
     Returns
     -------
     float
         Distance between the points in meters
-
     """
-    # convert decimal degrees to radians
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+    lon2, lat2 = radians(lon2), radians(lat2)
 
     # haversine formula
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    dlon = lon2 - lon1_r
+    dlat = lat2 - lat1_r
+    a = sin(dlat / 2) ** 2 + cos_lat1_r * cos(lat2) * sin(dlon / 2) ** 2
     c = 2 * asin(sqrt(a))
     r = 6371000  # Radius of earth in meters
     return c * r
+
+
+def haversine_vec(lon1: Union[float, np.ndarray], lat1: Union[float, np.ndarray],
+                  lon2: Union[float, np.ndarray], lat2: Union[float, np.ndarray]) -> np.ndarray:
+    """ Vectorized version of haversine, the coordinates are broadcast against each other, e.g. to calculate the
+    distances from many points to a single point
+
+    Parameters
+    ----------
+    lon1: array_like
+        Longitudes of first points
+    lat1: array_like
+        Latitudes of first points
+    lon2: array_like
+        Longitudes of second points
+    lat2: array_like
+        Latitudes of second points
+    Returns
+    -------
+    np.ndarray
+        Distances between the points in meters
+
+    """
+    lon1, lat1 = np.radians(lon1), np.radians(lat1)
+    return _haversine_precomp_vec(lon1, lat1, np.cos(lat1), lon2, lat2)
+
+
+def _haversine_precomp_vec(lon1_r: Union[float, np.ndarray], lat1_r: Union[float, np.ndarray],
+                           cos_lat1_r: Union[float, np.ndarray],
+                           lon2: Union[float, np.ndarray], lat2: Union[float, np.ndarray]) -> np.ndarray:
+    """ Vectorized version of _haversine_precomp
+
+    Parameters
+    ----------
+    lon1_r: array_like
+        Longitudes of first points in radians
+    lat1_r: array_like
+        Latitudes of first points in radians
+    cos_lat1_r: array_like
+        Cosines of the latitudes of the first points
+    lon2: array_like
+        Longitudes of second points
+    lat2: array_like
+        Latitudes of second points
+
+    Returns
+    -------
+    np.ndarray
+        Distances between the points in meters
+    """
+    lon2, lat2 = np.radians(lon2), np.radians(lat2)
+
+    dlon = lon2 - lon1_r
+    dlat = lat2 - lat1_r
+    a = np.sin(dlat / 2) ** 2 + cos_lat1_r * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arcsin(np.sqrt(a))
+    r = 6371000  # Radius of earth in meters
+    return c * r
@@ -1,13 +1,16 @@
 import itertools
 import logging
+import multiprocessing
 from datetime import timedelta
-from typing import Union
+from functools import partial
+from multiprocessing import Pool
+from typing import List, Union, Tuple, Dict, TYPE_CHECKING
 
 import numpy as np
 import pandas as pd
-from ipyleaflet import Map, ScaleControl, FullScreenControl, Circle, LayerGroup
-from scipy import signal, integrate
-from shapely.geometry import Point
+from scipy import signal
+import shapely
+from shapely.strtree import STRtree
 from tqdm.auto import tqdm
 
 from pyridy import Campaign, config
@@ -15,10 +18,181 @@ from pyridy.file import RDYFile
 from pyridy.osm.utils import convert_way_to_line_string, OSMResultNode
 from pyridy.processing import PostProcessor
 from pyridy.utils import LinearAccelerationSeries, GPSSeries
+from pyridy.utils.tools import create_result_layer, create_base_map
+
+if TYPE_CHECKING:
+    from ipyleaflet import Map
 
 logger = logging.getLogger(__name__)
 
 
+def _cum_trapz(y: np.ndarray, dx: float) -> np.ndarray:
+    """ Cumulative trapezoidal integral of uniformly sampled y, starting at 0
+
+    Parameters
+    ----------
+    y: np.ndarray
+        Values to integrate
+    dx: float
+        Spacing between the samples of y
+
+    Returns
+    -------
+    np.ndarray
+        Integral with the same length as y
+    """
+    if len(y) == 0:
+        return np.empty(0)
+    out = np.cumsum(y)
+    out -= (y[0] + y) / 2
+    out *= dx
+    return out
+
+
+def _resample_uniform(series: List[Tuple[np.ndarray, Dict[str, np.ndarray]]], step: timedelta) -> pd.DataFrame:
+    """ Resamples the arrays of one or more series onto a common uniform grid, equivalent to
+    pd.concat([s.to_df() for s in series]).resample(step).mean().interpolate() but without building DataFrames for
+    the raw series or sorting their concatenation. Samples are averaged per bin and empty bins are linearly
+    interpolated, values before the first valid sample of a column stay NaN
+
+    Parameters
+    ----------
+    series: list[tuple[np.ndarray, dict]]
+        Timestamps and value arrays of each series, as returned by TimeSeries.to_arrays
+    step: timedelta
+        Spacing of the uniform grid
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame on the uniform grid
+    """
+    step = pd.Timedelta(step)
+    indices = [pd.Index(t) for t, _ in series]
+    is_td = isinstance(indices[0], pd.TimedeltaIndex)
+
+    # Bins of a TimedeltaIndex start at the first sample, bins of a DatetimeIndex are aligned to the day
+    start = min(index.min() for index in indices)
+    if not is_td:
+        # Like pandas, the bins are aligned to midnight of the first day, not to the epoch, which differs for steps
+        # that do not divide a day
+        day = start.floor("D")
+        start = day + ((start - day) // step) * step
+    bins = [(index - start).asi8 // step.value for index in indices]
+    n = max(b.max() for b in bins) + 1
+    grid = np.arange(n)
+
+    # Columns sharing a name across series are merged like in pd.concat
+    sums, counts = {}, {}
+    for (_, cols), b in zip(series, bins):
+        for c, v in cols.items():
+            v = v.astype(float, copy=False)
+            valid = ~np.isnan(v)
+            if c not in sums:
+                sums[c], counts[c] = np.zeros(n), np.zeros(n, dtype=np.int64)
+            sums[c] += np.bincount(b[valid], weights=v[valid], minlength=n)
+            counts[c] += np.bincount(b[valid], minlength=n)
+
+    cols = {}
+    for c in sums:
+        filled = counts[c] > 0
+        if filled.any():
+            cols[c] = np.interp(grid, grid[filled], sums[c][filled] / counts[c][filled], left=np.nan)
+        else:
+            cols[c] = np.full(n, np.nan)
+
+    if is_td:
+        index = pd.timedelta_range(start, periods=n, freq=step, name="time")
+    else:
+        index = pd.date_range(start, periods=n, freq=step, name="time")
+    return pd.DataFrame(cols, index=index)
+
+
+def _high_pass(x: np.ndarray, sos: np.ndarray) -> np.ndarray:
+    """ Applies the zero-phase high-pass filter. The padding is shortened for signals with no more than 150 samples,
+    which sosfiltfilt would reject otherwise
+
+    Parameters
+    ----------
+    x: np.ndarray
+        Signal to filter
+    sos: np.ndarray
+        Second-order sections of the high-pass filter
+
+    Returns
+    -------
+    np.ndarray
+        Filtered signal
+    """
+    return signal.sosfiltfilt(sos, x, padlen=min(150, len(x) - 1))
+
+
+def _integrate_hp(x: np.ndarray, sos: np.ndarray, dx: float) -> np.ndarray:
+    """ Integrates the uniformly sampled signal and removes the resulting drift with the high-pass filter
+
+    The integrator has its pole on the unit circle, so it can't be merged into the zero-phase high-pass
+    filter and both stages are applied one after another
+
+    Parameters
+    ----------
+    x: np.ndarray
+        Uniformly sampled signal
+    sos: np.ndarray
+        Second-order sections of the high-pass filter
+    dx: float
+        Spacing between the samples of x
+
+    Returns
+    -------
+    np.ndarray
+        High-pass filtered integral of x
+    """
+    return _high_pass(_cum_trapz(x, dx), sos)
+
+
+def _calc_excitations(series: List[Tuple[np.ndarray, Dict[str, np.ndarray]]], step: timedelta, sos: np.ndarray,
+                      axes: List[str]) -> pd.DataFrame:
+    """ Resamples the measurements of a single file and calculates velocities and excitations for the given axes.
+    Only depends on its arguments, so that it can be run in worker processes
+
+    Parameters
+    ----------
+    series: list[tuple[np.ndarray, dict]]
+        Arrays of the linear acceleration series and optionally of the GPS series of the file
+    step: timedelta
+        Sampling period to be used
+    sos: np.ndarray
+        Second-order sections of the high-pass filter
+    axes: list[str]
+        Axes to calculate the excitations for
+
+    Returns
+    -------
+    pd.DataFrame
+        Resampled measurements including lin_v_<ax> and lin_s_<ax> columns
+    """
+    df = _resample_uniform(series, step)
+    dx = step.total_seconds()
+
+    col_map = {"x": "lin_acc_x", "y": "lin_acc_y", "z": "lin_acc_z"}
+    for ax in dict.fromkeys(axes):  # Each axis is only processed once
+        if ax not in col_map:
+            raise ValueError("axes must be 'x', 'y' or 'z', or list of these values")
+        lin_acc = df[col_map[ax]].to_numpy()
+
+        # High pass filter first to remove static offset
+        lin_acc_hp = _high_pass(lin_acc, sos)
+
+        # Integrate and High-Pass Filter
+        lin_v_hp = _integrate_hp(lin_acc_hp, sos, dx)
+        df["lin_v_" + ax] = lin_v_hp
+
+        lin_s_hp = _integrate_hp(lin_v_hp, sos, dx)
+        df["lin_s_" + ax] = lin_s_hp
+
+    return df
+
+
 class ExcitationProcessor(PostProcessor):
     def __init__(self, campaign: Campaign, f_s: int = 200, f_c: float = 0.1, order: int = 4,
                  p_thres: float = .025, p_dist: int = 50, osm_integration=True):
@@ -48,16 +222,46 @@ class ExcitationProcessor(PostProcessor):
         self.osm_integration = osm_integration
 
         self.b, self.a = signal.butter(self.order, 2 * self.f_c / self.f_s, 'high')  # High Pass (2*f_c/f_s)
+        self.sos = signal.butter(self.order, 2 * self.f_c / self.f_s, 'high', output='sos')
+
+    def _get_input_arrays(self, f: RDYFile, intp_gps: bool) -> List[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+        """ Returns the arrays of a file the excitations are calculated from
+
+        Parameters
+        ----------
+        f: RDYFile
+            File with linear acceleration measurements
+        intp_gps: bool
+            If true, GPS measurements are returned even if they are not needed to integrate results into OSM
+
+        Returns
+        -------
+        list[tuple[np.ndarray, dict]]
+            Arrays of the linear acceleration series and, if available and needed, of the GPS series
+        """
+        lin_acc = f.measurements[LinearAccelerationSeries].to_arrays()
 
-    def execute(self, axes: Union[str, list] = "z", intp_gps: bool = True, reset: bool = False):
+        if len(f.measurements[GPSSeries]) == 0:
+            logger.warning("(%s) GPSSeries is empty, can't interpolate GPS values onto results" % f.filename)
+            return [lin_acc]
+        elif intp_gps or (self.osm_integration and self.campaign.osm and f.matched_line):
+            return [lin_acc, f.measurements[GPSSeries].to_arrays()]
+        else:
+            return [lin_acc]
+
+    def execute(self, axes: Union[str, list] = "z", intp_gps: bool = True, reset: bool = False,
+                use_multiprocessing: bool = False):
         """ Executes the processor on the given axes
 
         Parameters
         ----------
+        use_multiprocessing: bool, default: False
+            If True, calculates the excitations of the files in parallel worker processes
         reset: bool
             Resets all result nodes
         intp_gps: bool, default: True
-            If true interpolates the GPS measurements onto the results
+            If true interpolates the GPS measurements onto the results. Otherwise, GPS measurements are only loaded
+            for files whose results are integrated into OSM data
         axes: str or list, default: "z"
             Axes to which processor should be applied to. Can be a single axis or a list of axes
         """
@@ -76,122 +280,93 @@ class ExcitationProcessor(PostProcessor):
         if reset and self.campaign.osm:
             self.campaign.osm.reset_way_attributes()
 
+        files = []
         f: RDYFile
-        for f in tqdm(self.campaign):
+        for f in self.campaign:
             if len(f.measurements[LinearAccelerationSeries]) == 0:
                 logger.warning("({f.filename}) LinearAccelerationSeries is empty, can't execute ExcitationProcessor "
                                "on this file")
-                continue
             else:
-                lin_acc_df = f.measurements[LinearAccelerationSeries].to_df()
-
-                if len(f.measurements[GPSSeries]) > 0:
-                    gps_df = f.measurements[GPSSeries].to_df()
-                    df = pd.concat([lin_acc_df, gps_df]).sort_index()
-                else:
-                    logger.warning(
-                        "(%s) GPSSeries is empty, can't interpolate GPS values onto results" % f.filename)
-                    df = lin_acc_df
-
-                df = df.resample(timedelta(seconds=1 / self.f_s)).mean().interpolate()
-                t = (df.index.values - df.index.values[0]) / np.timedelta64(1, "s")
-
-                for ax in axes:
-                    if ax == "x":
-                        lin_acc = df.lin_acc_x
-                    elif ax == "y":
-                        lin_acc = df.lin_acc_y
-                    elif ax == "z":
-                        lin_acc = df.lin_acc_x
-                    else:
-                        raise ValueError("axes must be 'x', 'y' or 'z', or list of these values")
+                files.append(f)
 
-                    # High pass filter first to remove static offset
-                    lin_acc_hp = signal.filtfilt(self.b, self.a, lin_acc, padlen=150)
-
-                    # Integrate and High-Pass Filter
-                    lin_v = integrate.cumtrapz(lin_acc_hp, t, initial=0)
-                    lin_v_hp = signal.filtfilt(self.b, self.a, lin_v, padlen=150)
-                    df["lin_v_" + ax] = lin_v_hp
-
-                    lin_s = integrate.cumtrapz(lin_v_hp, t, initial=0)
-                    lin_s_hp = signal.filtfilt(self.b, self.a, lin_s, padlen=150)
-                    df["lin_s_" + ax] = lin_s_hp
+        calc = partial(_calc_excitations, step=timedelta(seconds=1 / self.f_s), sos=self.sos, axes=axes)
+        inputs = map(partial(self._get_input_arrays, intp_gps=intp_gps), files)
+        if use_multiprocessing:
+            with Pool(multiprocessing.cpu_count()) as p:
+                dfs = list(tqdm(p.imap(calc, inputs), total=len(files)))
+        else:
+            dfs = tqdm(map(calc, inputs), total=len(files))
 
-                    # Peak nodes for OSM
-                    if self.osm_integration and len(f.measurements[GPSSeries]) > 0:
-                        if self.campaign.osm:
-                            lin_s_abs = np.abs(lin_s_hp)
+        # Results are integrated into the OSM ways in the main process only
+        way_lines_cache = {}  # Projected way lines and their STRtree per track, shared by all files on the track
+        for f, df in zip(files, dfs):
+            if "lon" in df:  # GPS positions are shared by all axes
+                lon_arr, lat_arr = df["lon"].to_numpy(), df["lat"].to_numpy()
 
+            for ax in axes:
+                # Peak nodes for OSM
+                if self.osm_integration and len(f.measurements[GPSSeries]) > 0:
+                    if self.campaign.osm:
+                        if f.matched_line:
+                            lin_s_hp = df["lin_s_" + ax].to_numpy()
                             p_idxs, prop = signal.find_peaks(lin_s_hp, height=self.p_thres, distance=self.p_dist)
-                            peaks = lin_s_abs[p_idxs]
-                            lons, lats = df.lon[p_idxs], df.lat[p_idxs]
+                            peaks = np.abs(lin_s_hp[p_idxs])
+                            lons, lats = lon_arr[p_idxs], lat_arr[p_idxs]
                             xs, ys = config.proj(lons, lats)
-                            if f.matched_line:
-                                trk = f.matched_line.tracks[0]
+
+                            trk = f.matched_line.tracks[0]
+                            if id(trk) not in way_lines_cache:
                                 way_lines = [convert_way_to_line_string(w, frmt="x,y") for w in trk.ways]
-                                for i, coord in enumerate(zip(xs, ys)):
-                                    p = Point(*coord)
-
-                                    # Get the closest way to point
-                                    dists = [line.distance(p) for line in way_lines]
-                                    min_d = min(dists)
-                                    if min_d <= config.options["RESULT_MATCHING_MAX_DISTANCE"]:
-                                        line = way_lines[dists.index(min_d)]
-                                        way = trk.ways[dists.index(min_d)]
-                                        pp = line.interpolate(line.project(p))  # Projection of GPS point to OSM line
-                                        lon, lat = config.proj(pp.x, pp.y, inverse=True)
-                                        r_node = OSMResultNode(lon, lat, peaks[i], f, proc=self, dir=ax)
-                                        if "results" not in way.attributes:
-                                            way.attributes["results"] = [r_node]
-                                        else:
-                                            way.attributes["results"].append(r_node)
-
-                        else:
-                            logger.warning("(%s) Campaign contains no OSM data, can't integrate results" % f.filename)
-                        pass
-
-                if ExcitationProcessor not in self.campaign.results:
-                    self.campaign.results[ExcitationProcessor] = {f.filename: df}
-                else:
-                    self.campaign.results[ExcitationProcessor][f.filename] = df
+                                way_lines_cache[id(trk)] = way_lines, STRtree(way_lines)
+                            way_lines, tree = way_lines_cache[id(trk)]
+                            pts = shapely.points(xs, ys)
+
+                            # Get the closest way to each point, on ties the first way wins. The tree only
+                            # considers ways whose bounding box is within the matching distance, so points
+                            # further away or without valid coordinates are left out
+                            p_idxs, w_idxs = tree.query_nearest(
+                                pts, max_distance=config.options["RESULT_MATCHING_MAX_DISTANCE"])
+                            nearest = np.full(len(pts), len(way_lines))
+                            np.minimum.at(nearest, p_idxs, w_idxs)
+
+                            # Project all points matched to the same way at once
+                            matches, pps = [], []
+                            for w_idx in np.unique(nearest[nearest < len(way_lines)]):
+                                line = way_lines[w_idx]
+                                idxs = np.flatnonzero(nearest == w_idx)
+
+                                # Projection of GPS points to OSM line
+                                locs = shapely.line_locate_point(line, pts[idxs])
+                                pps.append(shapely.line_interpolate_point(line, locs))
+                                matches.extend((trk.ways[w_idx], i) for i in idxs)
+
+                            if matches:
+                                pps = np.concatenate(pps)
+                                r_lons, r_lats = config.proj(shapely.get_x(pps), shapely.get_y(pps), inverse=True)
+                                for (way, i), lon, lat in zip(matches, r_lons.tolist(), r_lats.tolist()):
+                                    r_node = OSMResultNode(lon, lat, peaks[i], f, proc=self, dir=ax)
+                                    way.attributes.setdefault("results", []).append(r_node)
+
+                    else:
+                        logger.warning("(%s) Campaign contains no OSM data, can't integrate results" % f.filename)
+                    pass
+
+            self.campaign.results.setdefault(ExcitationProcessor, {})[f.filename] = df
 
         params = self.__dict__.copy()
         params.pop("campaign")
-        if ExcitationProcessor not in self.campaign.results:
-            self.campaign.results[ExcitationProcessor] = {"params": params}
-        else:
-            self.campaign.results[ExcitationProcessor]["params"] = params
+        self.campaign.results.setdefault(ExcitationProcessor, {})["params"] = params
         pass
 
-    def create_map(self, use_file_color=False) -> Map:
+    def create_map(self, use_file_color=False, grid_decimals: int = None) -> "Map":
         if not self.campaign.osm:
             raise ValueError("Campaign has no OSM data!")
 
         center = ((self.campaign.lat_sw + self.campaign.lat_ne) / 2,
                   (self.campaign.lon_sw + self.campaign.lon_ne) / 2)
 
-        m = Map(center=center, zoom=12, scroll_wheel_zoom=True, basemap=config.OPEN_STREET_MAP_DE)
-        m.add_control(ScaleControl(position='bottomleft'))
-        m.add_control(FullScreenControl())
-
-        # Add map
-        m.add_layer(config.OPEN_RAILWAY_MAP)
-
-        circles = []
-        nodes = list(itertools.chain.from_iterable([w.attributes.get("results", []) for w in self.campaign.osm.ways]))
-
-        n: OSMResultNode
-        for n in nodes:
-            circle = Circle()
-            circle.location = n.lon, n.lat
-            circle.radius = 2
-            circle.color = n.f.color if use_file_color else n.color
-            circle.fill_color = n.f.color if use_file_color else n.color
-            circle.weight = 3
-            circle.fill_opacity = 0.1
-            circles.append(circle)
-
-        l_circles = LayerGroup(layers=circles)
-        m.add_layer(l_circles)
+        m = create_base_map(center=center)
+
+        nodes = list(itertools.chain.from_iterable(w.attributes.get("results", ()) for w in self.campaign.osm.ways))
+        m.add_layer(create_result_layer(nodes, use_file_color=use_file_color, grid_decimals=grid_decimals))
         return m
@@ -1,19 +1,38 @@
 from typing import Union
 
+import numpy as np
 from pandas import Series
 
 
+def _first_value(v):
+    """ Returns the first value if v is a Series or array, None if it is empty, and v itself otherwise
+
+    Parameters
+    ----------
+    v
+
+    Returns
+    -------
+        First value of v
+    """
+    if isinstance(v, Series):
+        return v.iat[0] if len(v) > 0 else None
+    if isinstance(v, np.ndarray):
+        return v[0] if len(v) > 0 else None
+    return v
+
+
 class Device:
     def __init__(self,
-                 api_level: Union[int, Series] = -1,
-                 base_os: Union[str, Series] = "N/A",
-                 brand: Union[str, Series] = "N/A",
-                 manufacturer: Union[str, Series] = "N/A",
-                 device: Union[str, Series] = "N/A",
-                 product: Union[str, Series] = "N/A",
-                 model: Union[str, Series] = "N/A",
-                 gnss_hardware_model_name: Union[str, Series] = "N/A",
-                 gnss_year_of_hardware: Union[int, Series] = -1):
+                 api_level: Union[int, Series, np.ndarray] = -1,
+                 base_os: Union[str, Series, np.ndarray] = "N/A",
+                 brand: Union[str, Series, np.ndarray] = "N/A",
+                 manufacturer: Union[str, Series, np.ndarray] = "N/A",
+                 device: Union[str, Series, np.ndarray] = "N/A",
+                 product: Union[str, Series, np.ndarray] = "N/A",
+                 model: Union[str, Series, np.ndarray] = "N/A",
+                 gnss_hardware_model_name: Union[str, Series, np.ndarray] = "N/A",
+                 gnss_year_of_hardware: Union[int, Series, np.ndarray] = -1):
         """ Class representing Android device information
 
         Parameters
@@ -28,50 +47,15 @@ class Device:
         gnss_hardware_model_name
         gnss_year_of_hardware
         """
-        if type(api_level) == Series:
-            self.api_level = api_level[0] if len(api_level) > 0 else None
-        else:
-            self.api_level = api_level
-
-        if type(base_os) == Series:
-            self.base_os = base_os[0] if len(base_os) > 0 else None
-        else:
-            self.base_os = base_os
-
-        if type(brand) == Series:
-            self.brand = brand[0] if len(brand) > 0 else None
-        else:
-            self.brand = brand
-
-        if type(manufacturer) == Series:
-            self.manufacturer = manufacturer[0] if len(manufacturer) > 0 else None
-        else:
-            self.manufacturer = manufacturer
-
-        if type(device) == Series:
-            self.device = device[0] if len(device) > 0 else None
-        else:
-            self.device = device
-
-        if type(product) == Series:
-            self.product = product[0] if len(product) > 0 else None
-        else:
-            self.product = product
-
-        if type(model) == Series:
-            self.model = model[0] if len(model) > 0 else None
-        else:
-            self.model = model
-
-        if type(gnss_hardware_model_name) == Series:
-            self.gnss_hardware_model_name = gnss_hardware_model_name[0] if len(gnss_hardware_model_name) > 0 else None
-        else:
-            self.gnss_hardware_model_name = gnss_hardware_model_name
-
-        if type(gnss_year_of_hardware) == Series:
-            self.gnss_year_of_hardware = gnss_year_of_hardware[0] if len(gnss_year_of_hardware) > 0 else None
-        else:
-            self.gnss_year_of_hardware = gnss_year_of_hardware
+        self.api_level = _first_value(api_level)
+        self.base_os = _first_value(base_os)
+        self.brand = _first_value(brand)
+        self.manufacturer = _first_value(manufacturer)
+        self.device = _first_value(device)
+        self.product = _first_value(product)
+        self.model = _first_value(model)
+        self.gnss_hardware_model_name = _first_value(gnss_hardware_model_name)
+        self.gnss_year_of_hardware = _first_value(gnss_year_of_hardware)
 
     def __repr__(self):
         return "Brand: %s, Model: %s, Product: %s, Device: %s, Manufacturer: %s, Base OS: %s, API Level: %d, " \
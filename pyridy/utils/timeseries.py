@@ -1,14 +1,164 @@
 import datetime
 import logging
+import warnings
 from abc import ABC
-from typing import Union, List
+from typing import Union, List, Tuple, Dict
 
 import numpy as np
 import pandas as pd
+import shapely
+
+from .tools import to_datetime64
 
 logger = logging.getLogger(__name__)
 
 
+def _simplify_coords(coords: np.ndarray, max_points: int) -> np.ndarray:
+    """ Simplifies a polyline using Ramer-Douglas-Peucker until it has at most max_points vertices
+
+    Parameters
+    ----------
+    coords: np.ndarray
+        Array of shape (n, 2) containing the vertices
+    max_points: int
+        Maximum number of vertices to keep
+
+    Returns
+    -------
+    np.ndarray
+    """
+    coords = coords[np.isfinite(coords).all(axis=1)]
+    if len(coords) <= max_points:
+        return coords
+
+    line = shapely.linestrings(coords)
+    tolerance = np.hypot(*np.ptp(coords, axis=0)) / max_points
+
+    simplified = shapely.get_coordinates(shapely.simplify(line, tolerance))
+    while len(simplified) > max_points and tolerance > 0:
+        tolerance *= 2
+        simplified = shapely.get_coordinates(shapely.simplify(line, tolerance))
+
+    return simplified
+
+
+def _is_monotonic(a: np.ndarray) -> bool:
+    """ Checks whether an array is sorted ascending
+
+    Parameters
+    ----------
+    a: np.ndarray
+        Array to check
+
+    Returns
+    -------
+    bool
+    """
+    return len(a) < 2 or bool(np.all(a[1:] >= a[:-1]))
+
+
+def merge_sorted_times(times: List[np.ndarray]) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """ Merges sorted timestamp arrays into a single sorted array. Each array is inserted into the merged array via
+    np.searchsorted, so neither a full sort nor a hash table of the timestamps is required
+
+    Parameters
+    ----------
+    times: list of np.ndarray
+        Ascending timestamp arrays
+
+    Returns
+    -------
+        tuple[np.ndarray, list]
+            Merged timestamps and, for each input array, the positions of its samples in the merged array
+    """
+    merged = times[0]
+    positions = [np.arange(len(merged))]
+
+    for t in times[1:]:
+        # On equal timestamps, samples that are already merged are placed in front of the new ones
+        old_pos = np.arange(len(merged)) + np.searchsorted(t, merged, side="left")
+        new_pos = np.arange(len(t)) + np.searchsorted(merged, t, side="right")
+
+        m = np.empty(len(merged) + len(t), dtype=np.result_type(merged, t))
+        m[old_pos] = merged
+        m[new_pos] = t
+
+        positions = [old_pos[p] for p in positions] + [new_pos]
+        merged = m
+
+    return merged, positions
+
+
+def _block_view(arrays: List[np.ndarray]) -> Union[np.ndarray, None]:
+    """ Returns the 2D array whose rows are the given arrays, if they are consecutive rows of one C-contiguous array
+
+    Parameters
+    ----------
+    arrays: list of np.ndarray
+        1D arrays
+
+    Returns
+    -------
+        np.ndarray or None
+            View of shape (len(arrays), n) or None, if the arrays are not stored as consecutive rows
+    """
+    base = arrays[0].base
+    if type(base) != np.ndarray or base.ndim != 2 or not base.flags.c_contiguous or base.size == 0:
+        return None
+
+    offset = arrays[0].ctypes.data - base.ctypes.data
+    row_size = base.strides[0]
+    if offset < 0 or offset % row_size != 0 or offset // row_size + len(arrays) > base.shape[0]:
+        return None
+
+    i0 = offset // row_size
+    for i, a in enumerate(arrays):
+        if a.base is not base or a.dtype != base.dtype or a.shape != base.shape[1:] or \
+                a.strides != base.strides[1:] or a.ctypes.data != base.ctypes.data + (i0 + i) * row_size:
+            return None
+
+    return base[i0:i0 + len(arrays)]
+
+
+def _strip_timezone(datetimes: Union[list, np.ndarray]) -> np.ndarray:
+    """ Converts ISO 8601 strings to np.datetime64[us] in their local time, i.e., a UTC offset ("+02:00") or "Z" is
+    dropped like by datetime.fromisoformat(el).replace(tzinfo=None). The offsets are cut off all strings at once and
+    the remaining strings are parsed by numpy, strings it can't handle are converted one by one
+
+    Parameters
+    ----------
+    datetimes: list or np.ndarray
+        ISO 8601 strings
+
+    Returns
+    -------
+    np.ndarray
+    """
+    s = np.ascontiguousarray(datetimes)
+
+    if s.dtype.kind == "U" and s.ndim == 1 and len(s) > 0 and s.itemsize > 0:
+        chars = s.view(np.uint32).reshape(len(s), -1).copy()
+        lengths = np.char.str_len(s)
+        rows = np.arange(len(s))
+
+        ends_with_z = chars[rows, np.maximum(lengths - 1, 0)] == ord("Z")
+        sign_pos = np.maximum(lengths - 6, 0)
+        has_offset = (lengths >= 16) & np.isin(chars[rows, sign_pos], [ord("+"), ord("-")]) & \
+                     (chars[rows, np.maximum(lengths - 3, 0)] == ord(":"))
+        cut = np.where(ends_with_z, lengths - 1, np.where(has_offset, sign_pos, lengths))
+        chars[np.arange(chars.shape[1]) >= cut[:, None]] = 0
+
+        try:
+            # Remaining timezone information, e.g., offsets of another format, must not be converted to UTC by numpy
+            with warnings.catch_warnings():
+                warnings.simplefilter("error", DeprecationWarning)
+                return chars.view(s.dtype).ravel().astype("datetime64[us]")
+        except (ValueError, DeprecationWarning):
+            pass
+
+    return np.array([datetime.datetime.fromisoformat(el).replace(tzinfo=None) for el in s], dtype="datetime64[us]")
+
+
 class TimeSeries(ABC):
     def __init__(self, **kwargs):
         """ Abstract Baseclass representing TimeSeries like measurements
@@ -48,6 +198,35 @@ class TimeSeries(ABC):
             self._time = (self._time * 1e9).astype(np.int64)
 
         self.time = self._time.copy()
+        self._pack_columns()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Pickling copies each column separately
+        self._pack_columns()
+
+    def __eq__(self, other):
+        """ Series are equal if they are of the same class and contain the same timestamps and sub series. NaN values
+        at the same positions are considered equal, like in pd.DataFrame.equals
+        """
+        if type(other) != type(self):
+            return NotImplemented
+
+        t, values = self.to_arrays()
+        other_t, other_values = other.to_arrays()
+        if list(values) != list(other_values) or not np.array_equal(t, other_t):
+            return False
+
+        for k, v in values.items():
+            w = other_values[k]
+            # equal_nan is only supported for numeric arrays
+            if not np.array_equal(v, w, equal_nan=v.dtype.kind in "fc" and w.dtype.kind in "fc"):
+                return False
+
+        return True
+
+    # Defining __eq__ would make the (mutable) series unhashable, they stay hashable by identity instead
+    __hash__ = object.__hash__
 
     def __len__(self):
         if np.array_equal(self.time, np.array(None)):
@@ -90,6 +269,7 @@ class TimeSeries(ABC):
                         self.__setattr__(k, v[idxs])
 
                 self._timedelta: np.ndarray = np.diff(self._time)
+                self._pack_columns()
             else:
                 logger.debug("(%s) Cannot cutoff %s if timeseries is empty or series already starts at 0" %
                              (self.filename, self.__class__.__name__))
@@ -107,12 +287,126 @@ class TimeSeries(ABC):
             pd.DataFrame
 
         """
+        t, values = self.to_arrays()
+        if all(len(v) == len(t) for v in values.values()):
+            # Columns of equal length can be handed over to pandas directly without aligning a Series per column
+            return pd.DataFrame(values, index=pd.Index(t, name="time"))
+
         d = self.__dict__.copy()
         d.pop("rdy_format_version")
         d.pop("filename")
         d.pop("_timedelta")
         return pd.DataFrame(dict([(k, pd.Series(v)) for k, v in d.items()])).set_index("time")
 
+    def to_arrays(self) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """ Returns the timestamps and values of the Series without building a DataFrame. The values contain the same
+        columns as to_df
+
+        Returns
+        -------
+            tuple[np.ndarray, dict]
+                Timestamps and dict of value arrays
+        """
+        d = self.__dict__.copy()
+        for k in ["rdy_format_version", "filename", "_timedelta"]:
+            d.pop(k)
+
+        return np.asarray(d.pop("time")), {k: np.asarray(v) for k, v in d.items()}
+
+    def slice_by_time(self, t_start, t_end) -> pd.DataFrame:
+        """ Converts the samples with t_start <= time < t_end to a Pandas DataFrame. Since the timestamps are sorted,
+        the bounds are found by binary search and only the selected samples are converted
+
+        Parameters
+        ----------
+        t_start
+            Start of the time range (inclusive), e.g. "2021-05-06T14:51:40" for synchronized timestamps
+        t_end
+            End of the time range (exclusive)
+
+        Returns
+        -------
+            pd.DataFrame
+        """
+        t = np.asarray(self.time)
+        if __debug__:
+            assert _is_monotonic(t), "(%s) %s is not sorted by time" % (self.filename, self.__class__.__name__)
+
+        bounds = [to_datetime64(b) if type(b) == str and t.dtype.kind == "M" else b for b in (t_start, t_end)]
+        i0, i1 = np.searchsorted(t, np.asarray(bounds).astype(t.dtype), side="left")
+
+        d = self.__dict__.copy()
+        for k in ["rdy_format_version", "filename", "_timedelta"]:
+            d.pop(k)
+
+        return pd.DataFrame(dict([(k, pd.Series(v[i0:i1])) for k, v in d.items()])).set_index("time")
+
+    def merge_sorted(self, *others: "TimeSeries") -> pd.DataFrame:
+        """ Merges the Series with other Series into a single DataFrame indexed by time. The result equals
+        pd.concat([s.to_df() for s in series]).sort_index().groupby(level=0).mean(), but the already sorted timestamps
+        are merged directly instead of being concatenated, resorted and grouped
+
+        Parameters
+        ----------
+        others: TimeSeries
+            Series to merge with
+
+        Returns
+        -------
+            pd.DataFrame
+        """
+        times, columns = [], {}
+        for series in (self,) + others:
+            t, values = series.to_arrays()
+            if len(t) == 0:
+                # Empty series only contribute (empty) columns
+                for k in values:
+                    columns.setdefault(k, [])
+                continue
+
+            if not _is_monotonic(t):
+                logger.debug("(%s) %s is not sorted by time, sorting it before merging" % (series.filename,
+                                                                                          series.__class__.__name__))
+                order = np.argsort(t, kind="stable")
+                values = {k: v[order] if len(v) == len(t) else v for k, v in values.items()}
+                t = t[order]
+
+            for k, v in values.items():
+                columns.setdefault(k, []).append((len(times), v))
+            times.append(t)
+
+        if times:
+            time, positions = merge_sorted_times(times)
+        else:
+            time, positions = np.array([]), []
+
+        # Samples sharing a timestamp are averaged
+        starts = np.flatnonzero(np.r_[True, time[1:] != time[:-1]]) if len(time) > 0 else np.array([], dtype=int)
+        has_duplicates = len(starts) < len(time)
+
+        data = {}
+        for k, parts in columns.items():
+            # Like pd.DataFrame.groupby().mean(), non-numeric columns are dropped
+            if any(v.dtype.kind not in "iuf" for _, v in parts):
+                continue
+
+            col = np.full(len(time), np.nan)
+            for i, v in parts:
+                # Values without timestamp are dropped, timestamps without value are filled with NaN
+                n = min(len(v), len(times[i]))
+                col[positions[i][:n]] = v[:n]
+
+            if has_duplicates:
+                valid = ~np.isnan(col)
+                counts = np.add.reduceat(valid, starts)
+                sums = np.add.reduceat(np.where(valid, col, 0), starts)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    col = np.where(counts > 0, sums / counts, np.nan)
+
+            data[k] = col
+
+        return pd.DataFrame(data, index=pd.Index(time[starts], name="time"))
+
     def get_sub_series_names(self) -> list:
         """ Returns names of sub series (e.g., acc_x, acc_y, acc_z)
 
@@ -127,6 +421,55 @@ class TimeSeries(ABC):
 
         return list(d.keys())
 
+    def get_values(self, names: List[str] = None) -> np.ndarray:
+        """ Returns sub series as columns of a 2D array. If the sub series are stored next to each other, the array is
+        a view and no data is copied
+
+        Parameters
+        ----------
+        names: list of str, default: None
+            Names of the sub series, defaults to all float sub series that have a value for each timestamp
+
+        Returns
+        -------
+            np.ndarray
+                Array of shape (n, len(names))
+        """
+        if names is None:
+            names = self._get_block_columns()
+        if not names:
+            return np.empty((len(self), 0))
+
+        arrays = [np.asarray(getattr(self, k)) for k in names]
+        block = _block_view(arrays)
+        return block.T if block is not None else np.column_stack(arrays)
+
+    def _get_block_columns(self) -> List[str]:
+        """ Returns the names of the float sub series that have a value for each timestamp
+
+        Returns
+        -------
+            list
+        """
+        n = len(self)
+        return [k for k, v in self.__dict__.items()
+                if k not in ["rdy_format_version", "filename", "time", "_time", "_timedelta"]
+                and type(v) == np.ndarray and v.dtype == np.float64 and v.ndim == 1 and len(v) == n]
+
+    def _pack_columns(self):
+        """ Stores the float sub series as rows of one contiguous 2D array, the attributes become views of its rows.
+        Stacking the sub series with get_values then doesn't have to copy them
+        """
+        names = self._get_block_columns()
+        if len(names) < 2 or len(self) == 0:
+            return
+
+        arrays = [self.__dict__[k] for k in names]
+        if _block_view(arrays) is None:
+            block = np.stack(arrays)
+            for i, k in enumerate(names):
+                self.__dict__[k] = block[i]
+
     def get_duration(self) -> float:
         """ Calculates the duration of the TimeSeries in seconds
 
@@ -656,9 +999,14 @@ class GPSSeries(TimeSeries):
         args.pop("self")
         super(GPSSeries, self).__init__(**args)
 
-    def to_ipyleaflef(self) -> List[list]:
+    def to_ipyleaflef(self, max_points: int = None) -> List[list]:
         """
 
+        Parameters
+        ----------
+        max_points: int, default: None
+            If given, the track is simplified to at most max_points coordinates
+
         Returns
         -------
 
@@ -670,7 +1018,12 @@ class GPSSeries(TimeSeries):
             logger.warning("(%s) Coordinates are empty in GPSSeries" % self.filename)
             return [[]]
         else:
-            return [[lat, lon] for lat, lon in zip(self.lat, self.lon)]
+            coords = self.get_values(["lat", "lon"]).astype(float)
+            if max_points is not None and len(coords) > max_points:
+                coords = _simplify_coords(coords, max_points)
+
+            # 6 decimals (~0.1 m) are sufficient for drawing and keep the serialized widget state small
+            return np.round(coords, 6).tolist()
 
 
 class PressureSeries(TimeSeries):
@@ -808,7 +1161,7 @@ class NTPDatetimeSeries(TimeSeries):
 
         if len(self.ntp_datetime) > 0:
             if strip_timezone:
-                ntp_datetime = [datetime.datetime.fromisoformat(el).replace(tzinfo=None) for el in self.ntp_datetime]
-                self.ntp_datetime = np.array([np.datetime64(el) for el in ntp_datetime])
+                self.ntp_datetime = _strip_timezone(self.ntp_datetime)
             else:
-                self.ntp_datetime = np.array([np.datetime64(el) for el in self.ntp_datetime])
+                # Converts the whole array at once, the unit is inferred from the strings like for np.datetime64
+                self.ntp_datetime = np.array(self.ntp_datetime, dtype="datetime64")
@@ -1,12 +1,21 @@
+import functools
 import random
 import socket
-from typing import Optional, Union
+import tempfile
+import time
+from typing import Optional, Union, TYPE_CHECKING
 
 import numpy as np
-from ipyleaflet import Circle
 
 from pyridy import config
 
+if TYPE_CHECKING:
+    from ipyleaflet import Circle, GeoJSON, Icon, LayerGroup, Map, Marker
+
+_internet_check = [None, False]  # Time and result of the last check done by requires_internet
+_icon_cache = {}  # Shared marker icons per color
+_map_defaults = {"zoom": 12, "scroll_wheel_zoom": True, "prefer_canvas": True}  # Default arguments of create_base_map
+
 
 def internet(host="8.8.8.8", port=53, timeout=None):
     """ Function that returns True if an internet connection is available, False if otherwise
@@ -30,9 +39,9 @@ def internet(host="8.8.8.8", port=53, timeout=None):
         timeout = config.options["SOCKET_TIMEOUT"]
 
     try:
-        socket.setdefaulttimeout(timeout)
-        socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect((host, port))
-        return True
+        # Timeout is set on this socket only instead of changing the process-wide default
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
     except socket.error as ex:
         print(ex)
         return False
@@ -49,11 +58,164 @@ def generate_random_color(color_format: str = "RGB") -> Union[list, str]:
     if color_format == "RGB":
         return list(np.random.choice(range(256), size=3))
     elif color_format == "HEX":
-        return "#" + ''.join([random.choice('0123456789ABCDEF') for _ in range(6)])
+        return "#%06X" % random.getrandbits(24)
     else:
         raise ValueError("Format %s is not valid, must be 'RGB' or 'HEX' " % color_format)
 
 
+@functools.lru_cache(maxsize=1024)
+def to_datetime64(timestamp: str, unit: str = "ns") -> np.datetime64:
+    """ Parses an ISO 8601 timestamp to np.datetime64. Results are cached, so that timestamps used repeatedly, e.g., as
+    bounds for TimeSeries.slice_by_time or for df.loc[t_start:t_end] on a synchronized DataFrame, are parsed only once
+
+    Parameters
+    ----------
+    timestamp: str
+        Timestamp, e.g., "2021-05-06T14:51:40"
+    unit: str, default: "ns"
+        Unit of the resulting np.datetime64
+
+    Returns
+    -------
+    np.datetime64
+    """
+    return np.datetime64(timestamp, unit)
+
+
+def create_base_map(center, **kwargs) -> "Map":
+    """ Creates an ipyleaflet map with OpenStreetMap as basemap, the OpenRailwayMap layer and scale/fullscreen
+    controls
+
+    Parameters
+    ----------
+    center: tuple
+        Center of the map as (lat, lon)
+    kwargs
+        Additional arguments passed to Map, overriding the defaults
+
+    Returns
+    -------
+    Map
+    """
+    from ipyleaflet import Map, ScaleControl, FullScreenControl
+
+    m = Map(center=center, **{"basemap": config.OPEN_STREET_MAP_DE, **_map_defaults, **kwargs})
+    m.add_control(ScaleControl(position='bottomleft'))
+    m.add_control(FullScreenControl())
+
+    # Add map
+    m.add_layer(config.OPEN_RAILWAY_MAP)
+
+    return m
+
+
+def get_marker_icon(color: str = "blue") -> "Icon":
+    """ Returns the marker icon for the given color, icons are created once and shared between markers
+
+    Parameters
+    ----------
+    color: str
+        Color of the marker, see https://github.com/pointhi/leaflet-color-markers for available colors
+
+    Returns
+    -------
+    Icon
+    """
+    icon = _icon_cache.get(color)
+    if icon is None:
+        if color in ("green", "red"):
+            icon = config.START_ICON if color == "green" else config.END_ICON
+        else:
+            from ipyleaflet import Icon
+
+            icon = Icon(
+                icon_url=config._ICON_URL % color,
+                shadow_url='https://cdnjs.cloudflare.com/ajax/libs/leaflet/0.7.7/images/marker-shadow.png',
+                icon_size=[25, 41],
+                icon_anchor=[12, 41],
+                popup_anchor=[1, -34],
+                shadow_size=[41, 41])
+        _icon_cache[color] = icon
+
+    return icon
+
+
+def create_marker(lat: float, lon: float, color: str = "blue", popup=None) -> "Marker":
+    """ Creates an ipyleaflet marker using a shared icon of the given color
+
+    Parameters
+    ----------
+    lat: float
+    lon: float
+    color: str
+    popup: Union[str, Widget], default: None
+        Popup of the marker, strings are wrapped into an HTML widget
+
+    Returns
+    -------
+    Marker
+    """
+    from ipyleaflet import Marker
+
+    if type(popup) == str:
+        from ipywidgets import HTML
+
+        popup = HTML(value=popup)
+
+    # Widgets cannot be copied from a prototype (ipywidgets raises on copy), so markers are kept for the few
+    # per-file start/end points and bulk points are drawn as GeoJSON layers instead
+    return Marker(location=(lat, lon), draggable=False, icon=get_marker_icon(color), popup=popup)
+
+
+def map_to_html(m: "Map", path: str = None) -> Optional[str]:
+    """ Exports an ipyleaflet map as standalone HTML
+
+    Parameters
+    ----------
+    m: Map
+        Map to export
+    path: str, default: None
+        If given, the HTML is written directly to this file and None is returned
+
+    Returns
+    -------
+    str
+        HTML of the map if no path is given
+    """
+    if path is not None:
+        m.save(path)
+        return None
+
+    # Small maps stay in memory, large ones are spilled to disk while being serialized
+    with tempfile.SpooledTemporaryFile(max_size=config.options["MAP_HTML_SPOOL_SIZE"], mode="w+") as f:
+        m.save(f)
+        f.seek(0)
+        return f.read()
+
+
+def add_zoom_gate(m: "Map", group: "LayerGroup", layers: list, min_zoom: int):
+    """ Shows the layers of a layer group only when the map is zoomed in to at least min_zoom, so that heavy layers
+    are not rendered at low zoom levels
+
+    Parameters
+    ----------
+    m: Map
+        Map the layer group belongs to
+    group: LayerGroup
+        Layer group whose content is gated
+    layers: list
+        Layers that are shown within the group
+    min_zoom: int
+        Minimum zoom level to show the layers
+    """
+    def on_zoom(change):
+        visible = change["new"] >= min_zoom
+        if visible != (len(group.layers) > 0):
+            group.layers = layers if visible else []
+
+    m.observe(on_zoom, names="zoom")
+
+
 def create_map_circle(lat: float, lon: float, color="green", radius: int = 2):
     """ Creates an ipyleaflet circle marker
 
@@ -68,13 +230,66 @@ def create_map_circle(lat: float, lon: float, color="green", radius: int = 2):
     -------
     Circle
     """
-    circle = Circle()
-    circle.location = (lat, lon)
-    circle.radius = radius
-    circle.color = color
-    circle.fill_color = color
+    from ipyleaflet import Circle
+
+    return Circle(location=(lat, lon), radius=radius, color=color, fill_color=color)
 
-    return circle
+
+def create_result_layer(nodes: list, use_file_color: bool = False, grid_decimals: int = None) -> "GeoJSON":
+    """ Creates a single ipyleaflet layer showing result nodes as circles. Drawing all nodes in one GeoJSON layer is
+    much faster than creating a widget per node. Points of a GeoJSON layer are drawn as circle markers, so their radius
+    of 2 is given in pixels and, unlike the former Circle widgets with a radius of 2 meters, does not scale with the
+    zoom level
+
+    Parameters
+    ----------
+    nodes: list
+        List of OSMResultNode
+    use_file_color: bool, default: False
+        If True, nodes are drawn in the color of the file they originate from instead of their own color
+    grid_decimals: int, default: None
+        If given, nodes of the same color are aggregated on a grid of lon/lat rounded to this number of decimals.
+        Each grid cell is drawn as one circle at the mean position of its nodes, with a radius of 2 pixels times the
+        square root of the number of nodes
+
+    Returns
+    -------
+    GeoJSON
+    """
+    lons = np.fromiter((n.lon for n in nodes), dtype=np.float64, count=len(nodes))
+    lats = np.fromiter((n.lat for n in nodes), dtype=np.float64, count=len(nodes))
+    colors = np.array([n.f.color if use_file_color else n.color for n in nodes], dtype=str)
+
+    unique_colors, inv = np.unique(colors, return_inverse=True)
+
+    if grid_decimals is None:
+        # One MultiPoint feature per color, typically there is only one color per file
+        features = [{"type": "Feature",
+                     "geometry": {"type": "MultiPoint",
+                                  "coordinates": np.column_stack((lons[inv == i], lats[inv == i])).tolist()},
+                     "properties": {"color": color, "count": 1}} for i, color in enumerate(unique_colors.tolist())]
+    else:
+        cells = np.column_stack((inv, np.round(lons, grid_decimals), np.round(lats, grid_decimals)))
+        _, first, cell_inv, counts = np.unique(cells, axis=0, return_index=True, return_inverse=True,
+                                               return_counts=True)
+        cell_inv = cell_inv.reshape(-1)
+        cell_lons = np.bincount(cell_inv, weights=lons) / counts
+        cell_lats = np.bincount(cell_inv, weights=lats) / counts
+        cell_colors = colors[first]
+
+        features = [{"type": "Feature",
+                     "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                     "properties": {"color": color, "count": count}}
+                    for lon, lat, color, count in zip(cell_lons.tolist(), cell_lats.tolist(), cell_colors.tolist(),
+                                                      counts.tolist())]
+
+    from ipyleaflet import GeoJSON
+
+    return GeoJSON(data={"type": "FeatureCollection", "features": features},
+                   point_style={"radius": 2, "weight": 3, "fillOpacity": 0.1},
+                   style_callback=lambda feature: {"color": feature["properties"]["color"],
+                                                   "fillColor": feature["properties"]["color"],
+                                                   "radius": 2 * feature["properties"]["count"] ** .5})
 
 
 def requires_internet(func):
@@ -89,10 +304,16 @@ def requires_internet(func):
 
     """
 
+    @functools.wraps(func)
     def inner(*args, **kwargs):
-        if internet():
+        # Reuse a recent check instead of opening a new connection on every call
+        if _internet_check[0] is None or \
+                time.monotonic() - _internet_check[0] >= config.options["INTERNET_CHECK_INTERVAL"]:
+            _internet_check[:] = [time.monotonic(), internet()]
+
+        if _internet_check[1]:
             return func(*args, **kwargs)
         else:
             raise ConnectionError("This function requires an internet connection")
 
-    return inner()
+    return inner
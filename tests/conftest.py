@@ -0,0 +1,22 @@
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def matplotlib_backend():
+    """ Renders figures with the non-interactive Agg backend, so that plt.show() does not block. Only matplotlib itself
+    is imported here, pyplot is imported by the tests that plot
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    matplotlib.rcParams["savefig.dpi"] = 100
+
+
+@pytest.fixture(scope="module")
+def shared_fig():
+    """ Figure reused by the plotting tests of a module, tests clear it with fig.clf() before adding their axes """
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(11.69, 8.27))
+    yield fig
+    plt.close(fig)
@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+import pyridy
+from pyridy.analysis import align_devices
+from pyridy.utils import AccelerationSeries
+
+
+@pytest.fixture
+def my_campaign():
+    campaign = pyridy.Campaign()
+    campaign.import_folder("files/sqlite/sync", sync_method="ntp_time", cutoff=False)
+    return campaign
+
+
+def test_align_devices(my_campaign):
+    files = [my_campaign("device1.sqlite"), my_campaign("device2.sqlite")]
+    df_1 = files[0].measurements[AccelerationSeries].to_df()
+    df_2 = files[1].measurements[AccelerationSeries].to_df()
+
+    left = align_devices(files, AccelerationSeries)
+    assert (left[0].index == df_1.index).all() and (left[1].index == df_1.index).all()
+
+    outer = align_devices(files, AccelerationSeries, how="outer")
+    assert (outer[0].index == df_1.index.union(df_2.index)).all()
+    assert outer[1]["acc_z"].count() == df_2["acc_z"].count()
+    assert outer[0].index.is_unique and outer[0].index.is_monotonic_increasing
+
+    inner = align_devices(files, AccelerationSeries, how="inner")
+    assert (inner[0].index == df_1.index.intersection(df_2.index)).all()
+
+    with pytest.raises(ValueError):
+        align_devices(files, AccelerationSeries, how="foo")
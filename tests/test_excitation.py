@@ -1,9 +1,13 @@
 import logging
+from datetime import timedelta
 
+import numpy as np
+import pandas as pd
 import pytest
 
 import pyridy
 from pyridy.processing import ExcitationProcessor
+from pyridy.processing.excitation import _resample_uniform, _calc_excitations
 
 
 @pytest.fixture
@@ -17,3 +21,49 @@ def test_execute_excitation_processor(my_campaign, caplog):
     proc = ExcitationProcessor(my_campaign)
     proc.execute()
     assert True
+
+
+@pytest.mark.parametrize("f_s", [200, 300])
+def test_resample_uniform(f_s):
+    rng = np.random.default_rng(0)
+    t = pd.to_timedelta(np.cumsum(rng.random(500) * 0.02), unit="s")
+    df = pd.DataFrame({"a": rng.standard_normal(500), "b": np.r_[[np.nan] * 50, rng.standard_normal(450)]},
+                      index=pd.TimedeltaIndex(t, name="time"))
+    df.loc[df.index[::7], "a"] = np.nan
+    df_2 = pd.DataFrame({"a": rng.standard_normal(40), "c": rng.standard_normal(40)},
+                        index=pd.TimedeltaIndex(np.sort(rng.choice(t, 40)) - pd.Timedelta("3ms"), name="time"))
+
+    t_0 = pd.Timestamp("2022-01-01 10:00:00.0037")
+    for dfs in [[df], [df, df_2], [df.set_axis(t_0 + df.index), df_2.set_axis(t_0 + df_2.index)]]:
+        expected = pd.concat(dfs).sort_index().resample(timedelta(seconds=1 / f_s)).mean().interpolate()
+        result = _resample_uniform([(d.index.values, {c: d[c].values for c in d}) for d in dfs],
+                                   timedelta(seconds=1 / f_s))
+        assert result.index.equals(expected.index)
+        assert list(result.columns) == list(expected.columns)
+        assert np.allclose(result.values, expected.values, rtol=0, atol=1e-12, equal_nan=True)
+
+
+def test_calc_excitations_axes():
+    rng = np.random.default_rng(0)
+    t = pd.TimedeltaIndex(pd.to_timedelta(np.arange(2000) * 5, unit="ms"), name="time")
+    df = pd.DataFrame({"lin_acc_x": rng.standard_normal(2000), "lin_acc_y": rng.standard_normal(2000)}, index=t)
+    df["lin_acc_z"] = df["lin_acc_y"]
+
+    proc = ExcitationProcessor(pyridy.Campaign())
+    series = [(df.index.values, {c: df[c].values for c in df})]
+    result = _calc_excitations(series, timedelta(seconds=1 / proc.f_s), proc.sos, ["x", "z", "z"])
+    assert list(result.columns) == ["lin_acc_x", "lin_acc_y", "lin_acc_z", "lin_v_x", "lin_s_x", "lin_v_z", "lin_s_z"]
+    assert not np.allclose(result["lin_s_z"], result["lin_s_x"])
+
+    result_y = _calc_excitations(series, timedelta(seconds=1 / proc.f_s), proc.sos, ["y"])
+    assert np.array_equal(result["lin_s_z"], result_y["lin_s_y"])
+
+
+def test_calc_excitations_short_signal():
+    t = pd.to_timedelta(np.arange(100) * 5, unit="ms").values
+    series = [(t, {"lin_acc_x": np.sin(np.arange(100) / 5), "lin_acc_y": np.zeros(100), "lin_acc_z": np.zeros(100)})]
+
+    proc = ExcitationProcessor(pyridy.Campaign())
+    result = _calc_excitations(series, timedelta(seconds=1 / proc.f_s), proc.sos, ["x"])
+    assert len(result) == 100
+    assert np.isfinite(result["lin_s_x"]).all()
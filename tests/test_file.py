@@ -1,7 +1,44 @@
-from pyridy.file import RDYFile
+import json
+import math
+
+import pandas as pd
+import pytest
+
+from pyridy.file import RDYFile, _load_json
 
 
 def test_get_integrity_report():
     rdy_file = RDYFile(path="files/sqlite/sample3.sqlite")
     report = rdy_file.get_integrity_report()
     assert True
+
+
+def test_get_map_coords():
+    rdy_file = RDYFile(path="files/sqlite/sample2.sqlite")
+    coords = rdy_file.get_map_coords()
+
+    assert coords is rdy_file.get_map_coords()
+    assert coords is not rdy_file.get_map_coords(max_points=10)
+    assert len(rdy_file.get_map_coords(max_points=10)) <= 10
+
+
+@pytest.mark.parametrize("path", ["files/sqlite/sample1.sqlite", "files/rdy/sample1.rdy"])
+def test_to_df(path):
+    rdy_file = RDYFile(path=path)
+    series = list(rdy_file.measurements.values())
+
+    # Merging the sorted series must equal concatenating, sorting and grouping the DataFrames of the series
+    expected = pd.concat([s.to_df() for s in series]).sort_index().groupby(level=0).mean()
+    pd.testing.assert_frame_equal(rdy_file.to_df(interpolate=False), expected)
+    pd.testing.assert_frame_equal(rdy_file.to_df(), expected.interpolate())
+
+
+def test_load_json(tmp_path):
+    with open("files/rdy/sample2.rdy") as f:
+        assert _load_json("files/rdy/sample2.rdy") == json.load(f)
+
+    # NaN is not valid JSON, such files are parsed with the json module
+    path = tmp_path / "nan.rdy"
+    path.write_text('{"a": NaN, "b": [1, 2.5]}')
+    rdy = _load_json(str(path))
+    assert math.isnan(rdy["a"]) and rdy["b"] == [1, 2.5]
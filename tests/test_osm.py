@@ -3,6 +3,7 @@ import logging
 import pytest
 
 import pyridy
+from pyridy.osm import OSM
 
 
 @pytest.fixture
@@ -19,3 +20,26 @@ def test_get_switches_for_railway_line(my_campaign, caplog):
     sw = my_campaign.osm.get_switches_for_railway_line(rw_line)
 
     assert True
+
+
+def test_query_overpass_bad_request(monkeypatch, caplog):
+    class Response:
+        status_code = 400
+        content = b'<p><strong style="color:#FF0000">Error</strong>: line 1: parse error: Unknown type "foo" </p>'
+
+    class Session:
+        urls = []
+
+        def post(self, url, **kwargs):
+            self.urls.append(url)
+            return Response()
+
+    monkeypatch.setattr(pyridy.osm.osm, "internet", lambda *args, **kwargs: False)
+    monkeypatch.setattr(OSM, "_http_session", Session())
+
+    osm = OSM([6.0, 50.0, 6.1, 50.1], download=False)
+    assert osm.query_overpass("foo;") is None
+
+    # Bad requests are not retried on other instances and the error messages of Overpass are logged
+    assert Session.urls == [osm.overpass_api.url]
+    assert 'Unknown type "foo"' in caplog.text
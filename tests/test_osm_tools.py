@@ -1,4 +1,6 @@
-from pyridy.osm.utils import iou
+import numpy as np
+
+from pyridy.osm.utils import iou, haversine, haversine_vec
 
 
 def test_iou():
@@ -36,3 +38,21 @@ def test_iou():
     b2 = [-4, -4, -3, -3]
 
     assert iou(b1, b2) == 0
+
+
+def test_haversine_vec():
+    lon = np.array([6.0, 6.1, 7.0])
+    lat = np.array([50.0, 50.5, 51.0])
+
+    d = haversine_vec(lon, lat, 6.05, 50.2)
+    assert d.shape == (3,)
+    assert np.allclose(d, [haversine(lo, la, 6.05, 50.2) for lo, la in zip(lon, lat)])
+
+    assert np.array_equal(haversine(lon, lat, 6.05, 50.2), d)
+
+    src = (np.radians(6.05), np.radians(50.2), np.cos(np.radians(50.2)))
+    for lo, la, d_i in zip(lon, lat, d):
+        assert np.isclose(haversine(0, 0, lo, la, precomputed_src=src), d_i)
+
+    # The precomputed first point is also used for arrays of second points
+    assert np.allclose(haversine(None, None, lon, lat, precomputed_src=src), d)
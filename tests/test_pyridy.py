@@ -1,11 +1,10 @@
 import logging
 
 import numpy as np
-import matplotlib.pyplot as plt
-import overpy
 import pytest
 
 import pyridy
+from pyridy.file import RDYFile
 from pyridy.utils import AccelerationSeries, LinearAccelerationSeries, GPSSeries, GNSSMeasurementSeries, \
     MagnetometerSeries
 
@@ -51,6 +50,47 @@ def test_loading_files(my_campaign, caplog):
     assert len(my_campaign) == 12
 
 
+def test_loading_files_mp(my_campaign, caplog):
+    caplog.set_level(logging.DEBUG)
+    my_campaign.import_folder("files", use_multiprocessing=True, n_workers=2)
+    assert len(my_campaign) == 12
+
+    sequential = pyridy.Campaign()
+    sequential.import_folder("files", use_multiprocessing=False)
+    assert [f.filename for f in my_campaign.files] == [f.filename for f in sequential.files]
+
+
+def test_loading_files_cached(tmp_path, monkeypatch):
+    monkeypatch.setitem(pyridy.config.options, "FILE_CACHE_DIR", str(tmp_path))
+
+    parsed = pyridy.Campaign()
+    parsed.import_folder("files/sqlite", use_cache=True)
+    assert len(list(tmp_path.iterdir())) == len(parsed)
+
+    cached = pyridy.Campaign()
+    cached.import_folder("files/sqlite", use_cache=True)
+    for f_parsed, f_cached in zip(parsed.files, cached.files):
+        assert f_parsed.filename == f_cached.filename
+        assert np.array_equal(f_parsed.measurements[AccelerationSeries].acc_x,
+                              f_cached.measurements[AccelerationSeries].acc_x)
+
+    # fast_read does not change the loaded file, so the cached files are reused
+    cached.import_folder("files/sqlite", use_cache=True, fast_read=False)
+    assert len(list(tmp_path.iterdir())) == len(parsed)
+
+
+def test_loading_files_cached_pickle_error(tmp_path, monkeypatch):
+    monkeypatch.setitem(pyridy.config.options, "FILE_CACHE_DIR", str(tmp_path))
+
+    def dump(*args, **kwargs):
+        raise TypeError("cannot pickle")
+
+    monkeypatch.setattr(pyridy.cache.pickle, "dump", dump)
+    with pytest.raises(TypeError):
+        pyridy.cache.load_or_parse("files/sqlite/sample1.sqlite")
+    assert list(tmp_path.iterdir()) == []
+
+
 def test_loading_files_partial_series(my_partial_campaign, caplog):
     caplog.set_level(logging.DEBUG)
     my_partial_campaign.import_folder("files")
@@ -75,7 +115,7 @@ def test_exclude_folder(my_campaign, caplog):
     assert len(my_campaign) == 4
 
 
-def test_load_single_file(my_campaign, caplog):
+def test_load_single_file(my_campaign, shared_fig, caplog):
     caplog.set_level(logging.DEBUG)
     my_campaign.import_files("files/sqlite/sample3.sqlite", sync_method="ntp_time")
 
@@ -88,7 +128,8 @@ def test_load_single_file(my_campaign, caplog):
     acc_y = my_campaign.files[0].measurements[AccelerationSeries].acc_y
     acc_z = my_campaign.files[0].measurements[AccelerationSeries].acc_z
 
-    fig, ax = plt.subplots(3, 1, sharex="row", figsize=(11.69, 8.27))
+    shared_fig.clf()
+    ax = shared_fig.subplots(3, 1, sharex="row")
 
     ax[0].plot(t, acc_x)
     ax[1].plot(t, acc_y)
@@ -106,8 +147,6 @@ def test_load_single_file(my_campaign, caplog):
 
     # ax[0].set_ylim(-1, 1)
 
-    plt.show()
-
 
 def test_device_information_repr(my_campaign, caplog):
     caplog.set_level(logging.DEBUG)
@@ -116,6 +155,35 @@ def test_device_information_repr(my_campaign, caplog):
     assert True
 
 
+def test_get_file_by_name(my_campaign):
+    my_campaign.import_folder("files/rdy/", recursive=False)
+    assert my_campaign("sample2.rdy") is my_campaign.files[[f.filename for f in my_campaign].index("sample2.rdy")]
+    assert my_campaign("foo.rdy") == []
+
+    # Lookups reuse the dict of filenames as long as the files do not change
+    by_name = my_campaign._by_name
+    my_campaign("sample3.rdy")
+    assert my_campaign._by_name is by_name
+
+    # Files added or replaced directly are found as well
+    my_campaign.files[0], my_campaign.files[1] = my_campaign.files[1], my_campaign.files[0]
+    assert my_campaign(my_campaign.files[0].filename) is my_campaign.files[0]
+
+    my_campaign.import_files("files/rdy/sample1.rdy")
+    assert len(my_campaign("sample1.rdy")) == 2
+
+    # Replacing a file in place with a file of another name
+    f = RDYFile(path="files/sqlite/sample1.sqlite")
+    my_campaign.files[1] = f
+    assert my_campaign("sample1.sqlite") is f
+
+    my_campaign.files[2] = f
+    assert my_campaign("sample1.sqlite") == [f, f]
+
+    my_campaign.clear_files()
+    assert my_campaign("sample1.rdy") == []
+
+
 def test_loading_files_non_recursive(my_campaign, caplog):
     caplog.set_level(logging.DEBUG)
     my_campaign.import_folder("files/rdy/", recursive=False)
@@ -139,6 +207,16 @@ def test_get_sub_series_names(my_campaign, caplog):
     assert sub_series_types == ["acc_x", "acc_y", "acc_z"]
 
 
+def test_submodule_access():
+    for name in ["utils", "file", "osm", "campaign"]:
+        assert getattr(pyridy, name).__name__ == "pyridy." + name
+        assert name in dir(pyridy)
+
+    assert pyridy.Campaign is pyridy.campaign.Campaign
+    with pytest.raises(AttributeError):
+        pyridy.foo
+
+
 def test_osm_map_matching(my_campaign, caplog):
     caplog.set_level(logging.DEBUG)
     my_campaign.import_folder("files/sqlite/osm_mapping_test", download_osm_region=True, railway_types=["tram"],
@@ -170,7 +248,7 @@ def test_timestamp_syncing(my_campaign, caplog):
     pass
 
 
-def test_device_time_syncing(my_campaign, caplog):
+def test_device_time_syncing(my_campaign, shared_fig, caplog):
     my_campaign.import_folder("files", sync_method="device_time", cutoff=False)
 
     assert my_campaign("sample1.rdy").measurements[AccelerationSeries].time[0] == np.datetime64(
@@ -180,30 +258,29 @@ def test_device_time_syncing(my_campaign, caplog):
     assert my_campaign("sample2.sqlite").measurements[AccelerationSeries].time[0] == np.datetime64(
         "2021-04-28T09:51:54.583858628")
 
-    df_acc_1 = my_campaign("device1.sqlite").measurements[AccelerationSeries].to_df()
-    df_acc_2 = my_campaign("device2.sqlite").measurements[AccelerationSeries].to_df()
+    acc_1 = my_campaign("device1.sqlite").measurements[AccelerationSeries]
+    acc_2 = my_campaign("device2.sqlite").measurements[AccelerationSeries]
 
     t_start = "2021-05-06T14:51:40"
     t_end = "2021-05-06T14:51:50"
 
-    fig, ax = plt.subplots(figsize=(11.69, 8.27))
-    ax.plot(df_acc_1[(df_acc_1.index >= t_start) & (df_acc_1.index < t_end)]["acc_z"],
+    shared_fig.clf()
+    ax = shared_fig.subplots()
+    ax.plot(acc_1.slice_by_time(t_start, t_end)["acc_z"],
             label="Device 1", linewidth=1)
-    ax.plot(df_acc_2[(df_acc_2.index >= t_start) & (df_acc_2.index < t_end)]["acc_z"],
+    ax.plot(acc_2.slice_by_time(t_start, t_end)["acc_z"],
             label="Device 2", linewidth=1)
 
     ax.set(xlabel='Time [s]', ylabel='Acceleration [m/s^2]', title='Device time syncing test')
     ax.grid()
     ax.legend()
 
-    fig.savefig("files/sqlite/sync/device_time_sync.png", dpi=300)
-
-    plt.show()
+    shared_fig.savefig("files/sqlite/sync/device_time_sync.png")
 
     pass
 
 
-def test_gps_time_syncing(my_campaign, caplog):
+def test_gps_time_syncing(my_campaign, shared_fig, caplog):
     my_campaign.import_folder("files", sync_method="gps_time", strip_timezone=False, cutoff=False)
 
     assert my_campaign("sample1.rdy").measurements[AccelerationSeries].time[0] == 0
@@ -212,38 +289,37 @@ def test_gps_time_syncing(my_campaign, caplog):
     assert my_campaign("sample2.sqlite").measurements[AccelerationSeries].time[0] == np.datetime64(
         "2021-04-28T07:51:56.892826255")
 
-    df_acc_1 = my_campaign("device1.sqlite").measurements[LinearAccelerationSeries].to_df()
-    df_acc_2 = my_campaign("device2.sqlite").measurements[LinearAccelerationSeries].to_df()
+    acc_1 = my_campaign("device1.sqlite").measurements[LinearAccelerationSeries]
+    acc_2 = my_campaign("device2.sqlite").measurements[LinearAccelerationSeries]
 
-    df_gps_1 = my_campaign("device1.sqlite").measurements[GPSSeries].to_df()
-    df_gps_2 = my_campaign("device2.sqlite").measurements[GPSSeries].to_df()
+    gps_1 = my_campaign("device1.sqlite").measurements[GPSSeries]
+    gps_2 = my_campaign("device2.sqlite").measurements[GPSSeries]
 
     t_start = "2021-05-06T12:51:40"
     t_end = "2021-05-06T12:51:50"
 
-    fig, ax = plt.subplots(2, 1, figsize=(11.69, 8.27))
-    ax[0].plot(df_acc_1[(df_acc_1.index >= t_start) & (df_acc_1.index < t_end)]["lin_acc_z"],
+    shared_fig.clf()
+    ax = shared_fig.subplots(2, 1)
+    ax[0].plot(acc_1.slice_by_time(t_start, t_end)["lin_acc_z"],
                label="Device 1", linewidth=1)
-    ax[0].plot(df_acc_2[(df_acc_2.index >= t_start) & (df_acc_2.index < t_end)]["lin_acc_z"],
+    ax[0].plot(acc_2.slice_by_time(t_start, t_end)["lin_acc_z"],
                label="Device 2", linewidth=1)
 
     ax[0].set(xlabel='Time [s]', ylabel='Acceleration [m/s^2]', title='GPS time syncing test')
     ax[0].grid()
     ax[0].legend()
 
-    ax[1].plot(df_gps_1[(df_gps_1.index >= t_start) & (df_gps_1.index < t_end)]["utc_time"],
+    ax[1].plot(gps_1.slice_by_time(t_start, t_end)["utc_time"],
                label="Device 1", linewidth=1)
-    ax[1].plot(df_gps_2[(df_gps_2.index >= t_start) & (df_gps_2.index < t_end)]["utc_time"],
+    ax[1].plot(gps_2.slice_by_time(t_start, t_end)["utc_time"],
                label="Device 2", linewidth=1)
 
-    fig.savefig("files/sqlite/sync/gps_time_sync.png", dpi=300)
-
-    plt.show()
+    shared_fig.savefig("files/sqlite/sync/gps_time_sync.png")
 
     pass
 
 
-def test_ntp_time_syncing(my_campaign, caplog):
+def test_ntp_time_syncing(my_campaign, shared_fig, caplog):
     my_campaign.import_folder("files", sync_method="ntp_time", cutoff=False)
 
     assert my_campaign("device1.sqlite").measurements[AccelerationSeries].time[0] == np.datetime64(
@@ -251,24 +327,23 @@ def test_ntp_time_syncing(my_campaign, caplog):
     assert my_campaign("device2.sqlite").measurements[AccelerationSeries].time[0] == np.datetime64(
         "2021-05-06T14:51:13.705642452")
 
-    df_acc_1 = my_campaign("device1.sqlite").measurements[AccelerationSeries].to_df()
-    df_acc_2 = my_campaign("device2.sqlite").measurements[AccelerationSeries].to_df()
+    acc_1 = my_campaign("device1.sqlite").measurements[AccelerationSeries]
+    acc_2 = my_campaign("device2.sqlite").measurements[AccelerationSeries]
 
     t_start = "2021-05-06T14:51:40"
     t_end = "2021-05-06T14:51:50"
 
-    fig, ax = plt.subplots(figsize=(11.69, 8.27))
-    ax.plot(df_acc_1[(df_acc_1.index >= t_start) & (df_acc_1.index < t_end)]["acc_z"],
+    shared_fig.clf()
+    ax = shared_fig.subplots()
+    ax.plot(acc_1.slice_by_time(t_start, t_end)["acc_z"],
             label="Device 1", linewidth=1)
-    ax.plot(df_acc_2[(df_acc_2.index >= t_start) & (df_acc_2.index < t_end)]["acc_z"],
+    ax.plot(acc_2.slice_by_time(t_start, t_end)["acc_z"],
             label="Device 2", linewidth=1)
 
     ax.set(xlabel='Time [s]', ylabel='Acceleration [m/s^2]', title='NTP time syncing test')
     ax.grid()
     ax.legend()
 
-    fig.savefig("files/sqlite/sync/ntp_time_sync.png", dpi=300)
-
-    plt.show()
+    shared_fig.savefig("files/sqlite/sync/ntp_time_sync.png")
 
     pass
@@ -1,10 +1,11 @@
 import overpy
-from matplotlib import pyplot as plt
 
 from pyridy.osm.utils import OSMRelation
 
 
 def test_osmrelation():
+    from matplotlib import pyplot as plt
+
     api = overpy.Overpass()
     query = """
         <union>
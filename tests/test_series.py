@@ -1,7 +1,8 @@
+import numpy as np
 import pandas as pd
 import pytest
 
-from pyridy.utils import AccelerationSeries
+from pyridy.utils import AccelerationSeries, GPSSeries, NTPDatetimeSeries
 
 
 @pytest.fixture
@@ -24,3 +25,95 @@ def test_acceleration_series_to_df(my_acc_series):
 
     acc_df = my_acc_series.to_df()
     assert acc_df.equals(test_df)
+
+
+def test_acceleration_series_to_arrays(my_acc_series):
+    t, values = my_acc_series.to_arrays()
+    acc_df = my_acc_series.to_df()
+
+    assert list(values.keys()) == list(acc_df.columns)
+    assert (t == acc_df.index.values).all()
+    for k, v in values.items():
+        assert (v == acc_df[k].values).all()
+
+
+def test_acceleration_series_eq(my_acc_series):
+    other = AccelerationSeries(time=[1.1, 2, 3],
+                               acc_x=[0.1, -2, 3],
+                               acc_y=[-0.3, 0, 3.4],
+                               acc_z=[0.6, 3, -3])
+    assert my_acc_series == other
+
+    other.acc_z[1] = np.nan
+    assert my_acc_series != other
+
+    my_acc_series.acc_z[1] = np.nan
+    assert my_acc_series == other
+    assert my_acc_series != GPSSeries(time=[1.1, 2, 3])
+
+    # Series are still hashed by identity, e.g., to be used in sets
+    assert hash(my_acc_series) == hash(my_acc_series) and len({my_acc_series, other}) == 2
+
+
+def test_acceleration_series_get_values(my_acc_series):
+    values = my_acc_series.get_values()
+
+    assert values.shape == (3, 3)
+    assert np.shares_memory(values, my_acc_series.acc_x)
+    assert (values[:, 1] == my_acc_series.acc_y).all()
+    assert (my_acc_series.get_values(["acc_z", "acc_x"]) == values[:, [2, 0]]).all()
+
+    my_acc_series.cutoff(1, 3)
+    assert np.shares_memory(my_acc_series.get_values(), my_acc_series.acc_z)
+
+
+def test_acceleration_series_merge_sorted(my_acc_series):
+    other = AccelerationSeries(time=[0.5, 2, 2, 4],
+                               acc_x=[1, 2, 4, 5],
+                               acc_y=[0, 0, 0, 0],
+                               acc_z=[1, 1, 1, 1])
+
+    merged = my_acc_series.merge_sorted(other)
+    expected = pd.concat([my_acc_series.to_df(), other.to_df()]).sort_index().groupby(level=0).mean()
+
+    pd.testing.assert_frame_equal(merged, expected)
+    assert merged.loc[2.0, "acc_x"] == pytest.approx(4 / 3)
+
+
+def test_acceleration_series_slice_by_time(my_acc_series):
+    acc_df = my_acc_series.to_df()
+
+    for t_start, t_end in [(1.1, 3), (0, 10), (1.5, 3.5), (3, 1)]:
+        expected = acc_df[(acc_df.index >= t_start) & (acc_df.index < t_end)]
+        pd.testing.assert_frame_equal(my_acc_series.slice_by_time(t_start, t_end), expected, check_index_type=False)
+
+
+def test_ntp_datetime_series():
+    ntp_datetime = ["2022-05-10T14:02:45.721+02:00", "2022-05-10T14:02:55.733+02:00"]
+
+    with pytest.warns(DeprecationWarning):
+        utc = NTPDatetimeSeries(time=[1, 2], ntp_datetime=ntp_datetime)
+    assert utc.ntp_datetime.dtype == np.dtype("datetime64[ms]")
+    assert utc.ntp_datetime[0] == np.datetime64("2022-05-10T12:02:45.721")
+
+    local = NTPDatetimeSeries(time=[1, 2], ntp_datetime=ntp_datetime, strip_timezone=True)
+    assert local.ntp_datetime.dtype == np.dtype("datetime64[us]")
+    assert local.ntp_datetime[1] == np.datetime64("2022-05-10T14:02:55.733")
+
+    # Offsets differing between samples (e.g., daylight saving time) are dropped as well
+    local = NTPDatetimeSeries(time=[1, 2, 3], ntp_datetime=["2022-03-27T01:59:59.5+01:00", "2022-03-27T03:00:00+02:00",
+                                                            "2022-03-27T01:00:00Z"], strip_timezone=True)
+    assert (local.ntp_datetime == np.array(["2022-03-27T01:59:59.5", "2022-03-27T03:00:00", "2022-03-27T01:00:00"],
+                                           dtype="datetime64[us]")).all()
+
+
+def test_gps_series_to_ipyleaflef_max_points():
+    t = np.arange(10000)
+    gps_series = GPSSeries(time=t, lat=50 + np.sin(t / 500) * 1e-2, lon=6 + t * 1e-5)
+
+    assert len(gps_series.to_ipyleaflef()) == 10000
+
+    coords = gps_series.to_ipyleaflef(max_points=500)
+    assert len(coords) <= 500
+    assert coords[0] == pytest.approx([gps_series.lat[0], gps_series.lon[0]], abs=1e-6)
+    assert coords[-1] == pytest.approx([gps_series.lat[-1], gps_series.lon[-1]], abs=1e-6)
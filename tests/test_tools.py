@@ -1,6 +1,9 @@
 import numpy as np
+import pytest
 
-from pyridy.osm.utils import project_point_onto_line, is_point_within_line_projection
+from pyridy.osm.utils import project_point_onto_line, is_point_within_line_projection, project_points_onto_line, \
+    project_points_onto_lines
+from pyridy.utils import tools
 
 
 def test_project_point_onto_line():
@@ -16,6 +19,39 @@ def test_project_point_onto_line():
     assert np.array_equal(p, np.array([1100, 0]))
 
 
+def test_project_points_onto_line():
+    points = np.array([[0.5, 0.5], [1100, .5], [-2, -3]])
+    p, d = project_points_onto_line(line=[[0, 0], [1, 0]], points=points)
+
+    assert p.shape == (3, 2)
+    assert np.array_equal(d, np.array([0.5, 0.5, 3]))
+    assert np.array_equal(p, np.array([[0.5, 0], [1100, 0], [-2, 0]]))
+
+    p_b, d_b = project_points_onto_line(line=[[0, 0], [1, 1]], points=points)
+    for i, point in enumerate(points):
+        p_i, d_i = project_point_onto_line(line=[[0, 0], [1, 1]], point=point)
+        assert np.allclose(p_b[i], p_i)
+        assert np.isclose(d_b[i], d_i)
+
+
+def test_project_points_onto_lines():
+    points = np.array([[0.5, 0.5], [1100, .5], [-2, -3]])
+    lines = np.array([[[0, 0], [1, 0]], [[0, 0], [1, 1]], [[0, 0], [-1, 0]]])
+    p, d, within = project_points_onto_lines(lines=lines, points=points)
+
+    assert p.shape == (3, 3, 2)
+    for i, point in enumerate(points):
+        for j, line in enumerate(lines):
+            p_ij, d_ij = project_point_onto_line(line=line, point=point)
+            assert np.array_equal(p[i, j], p_ij)
+            assert d[i, j] == d_ij
+            assert within[i, j] == is_point_within_line_projection(line=line, point=point)
+
+    # Degenerated lines do not raise but result in NaN
+    p, d, within = project_points_onto_lines(lines=[[[1, 1], [1, 1]]], points=points)
+    assert np.isnan(d).all()
+
+
 def test_is_point_within_line_projection():
     b = is_point_within_line_projection(line=[[0, 0], [1, 0]], point=[1100, .5])
     assert not b
@@ -31,3 +67,88 @@ def test_is_point_within_line_projection():
 
     b = is_point_within_line_projection(line=[[0, 0], [1, 1]], point=[.5, .5])
     assert b
+
+
+def test_requires_internet(monkeypatch):
+    checks = []
+    monkeypatch.setattr(tools, "internet", lambda: checks.append(True) or len(checks) == 1)
+    monkeypatch.setattr(tools, "_internet_check", [None, False])
+
+    @tools.requires_internet
+    def double(x):
+        return 2 * x
+
+    assert double.__name__ == "double"
+    assert len(checks) == 0  # Decorating must not check the connection
+
+    assert double(2) == 4
+    assert double(3) == 6
+    assert len(checks) == 1  # Result of the first check is reused
+
+    monkeypatch.setitem(tools.config.options, "INTERNET_CHECK_INTERVAL", 0)
+    with pytest.raises(ConnectionError):
+        double(4)
+
+
+def test_create_marker_shares_icon():
+    m1 = tools.create_marker(50.0, 6.0, color="black")
+    m2 = tools.create_marker(51.0, 7.0, color="black")
+
+    assert m1.icon is m2.icon
+    assert list(m1.location) == [50.0, 6.0]
+    assert tools.create_marker(50.0, 6.0, color="green").icon is tools.config.START_ICON
+
+
+def test_map_to_html(tmp_path):
+    from ipyleaflet import Map
+
+    m = Map(center=(50.0, 6.0), zoom=12)
+    html = tools.map_to_html(m)
+    assert html.startswith("<!DOCTYPE html>")
+
+    assert tools.map_to_html(m, path=str(tmp_path / "map.html")) is None
+    assert (tmp_path / "map.html").read_text() == html
+
+
+def test_add_zoom_gate():
+    from ipyleaflet import Map, LayerGroup, Polyline
+
+    m = Map(center=(50.0, 6.0), zoom=12)
+    layers = [Polyline(locations=[[50.0, 6.0], [50.1, 6.1]])]
+    group = LayerGroup(layers=layers)
+    m.add_layer(group)
+    tools.add_zoom_gate(m, group, layers, min_zoom=11)
+
+    m.zoom = 8
+    assert len(group.layers) == 0
+
+    m.zoom = 11
+    assert len(group.layers) == 1
+
+
+def test_create_result_layer_grid():
+    class Node:
+        def __init__(self, lon, lat, color):
+            self.lon, self.lat, self.color = lon, lat, color
+
+    nodes = [Node(6.0001, 50.0001, "red"), Node(6.0003, 50.0003, "red"), Node(6.0002, 50.0002, "blue"),
+             Node(6.5, 50.5, "red")]
+
+    features = tools.create_result_layer(nodes).data["features"]
+    assert len(features) == 2
+
+    features = tools.create_result_layer(nodes, grid_decimals=2).data["features"]
+    assert sorted((f["properties"]["color"], f["properties"]["count"]) for f in features) == \
+           [("blue", 1), ("red", 1), ("red", 2)]
+
+    red = [f for f in features if f["properties"]["count"] == 2][0]
+    assert red["geometry"]["coordinates"] == pytest.approx([6.0002, 50.0002])
+
+
+def test_to_datetime64():
+    t = tools.to_datetime64("2021-05-06T14:51:40")
+
+    assert t == np.datetime64("2021-05-06T14:51:40.000000000")
+    assert t.dtype == np.dtype("datetime64[ns]")
+    assert tools.to_datetime64("2021-05-06T14:51:40") is t
+    assert tools.to_datetime64("2021-05-06T14:51:40", "s").dtype == np.dtype("datetime64[s]")